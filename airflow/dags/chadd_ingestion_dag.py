@@ -5,6 +5,7 @@ from airflow.operators.python_operator import PythonOperator, BranchPythonOperat
 from airflow.operators.dummy_operator import DummyOperator
 
 from src.chadd_scraping import *
+from src.utils.indexes import ensure_indexes_func
 from src.reddit_scrapping import connect_to_mongo, test_mongo
 
 
@@ -21,6 +22,12 @@ chadd_dag = DAG(
     catchup=False,
 )
 
+# Opt-in: when True, the ingestion database is kept and only the months after the stored
+# watermark (plus a look-back window) are scraped, instead of rebuilding everything up to 2025-01.
+INCREMENTAL = False
+# Store the responses in chadd_staging_db.responses instead of embedding them in the posts
+SEPARATE_RESPONSES = False
+
 #----------------------
 
 def branch_on_check_cookies(**kwargs):
@@ -32,7 +39,7 @@ def branch_on_check_cookies(**kwargs):
 
 def branch_on_mango_connection():
     if connect_to_mongo():
-        return 'clean_ingestion_db'
+        return 'prepare_ingestion_db' if INCREMENTAL else 'clean_ingestion_db'
     else:
         return 'stop_task'
 
@@ -49,6 +56,12 @@ clean_ingestion_db_task = PythonOperator(
     python_callable=clean_ingestion_db_func,
 )
 
+prepare_ingestion_db_task = PythonOperator(
+    task_id='prepare_ingestion_db',
+    dag=chadd_dag,
+    python_callable=prepare_ingestion_db,
+)
+
 # Branch task based on MongoDB connection
 branch_mongo_task = BranchPythonOperator(
     task_id='branch_mongo_task',
@@ -57,11 +70,18 @@ branch_mongo_task = BranchPythonOperator(
     provide_context=True,
 )
 
+ensure_indexes_task = PythonOperator(
+    task_id='ensure_indexes',
+    dag=chadd_dag,
+    python_callable=ensure_indexes_func,
+    op_kwargs={'databases': ['chadd_ingestion_db', 'chadd_staging_db']},
+    trigger_rule='none_failed_min_one_success',
+)
+
 check_cookie_task = PythonOperator(
     task_id='check_cookie',
     dag=chadd_dag,
     python_callable=check_cookie_file,
-    trigger_rule='all_success',
     depends_on_past=False,
 )
 
@@ -93,11 +113,15 @@ stop_task = DummyOperator(
 fetch_posts_task = PythonOperator(
     task_id='fetch_posts_task',
     dag=chadd_dag,
-    python_callable=fetch_posts_task,
+    python_callable=fetch_new_posts_task if INCREMENTAL else fetch_posts_task,
     trigger_rule='none_failed_min_one_success',
     op_kwargs={
         'start_date': '2017-07',
-        'end_date': '2025-01',
+        # Incremental runs go up to the current month
+        'end_date': None if INCREMENTAL else '2025-01',
+        'lookback_months': 1,
+        'max_workers': 8,
+        'requests_per_second': 5,
     }
 )
 
@@ -105,28 +129,61 @@ fetch_members_task = PythonOperator(
     task_id='fetch_members_task',
     dag=chadd_dag,
     python_callable=fetch_members_for_posts,
+    op_kwargs={
+        'reuse_embedded_authors': True,
+        'profile_max_age_days': 30,
+        'incremental': INCREMENTAL,
+    }
 )
 
 fill_posts_collection_task = PythonOperator(
     task_id='fill_posts_collection_task',
     dag=chadd_dag,
     python_callable=fetch_post_details,
+    op_kwargs={
+        'max_workers': 8,
+        'requests_per_second': 5,
+        'batch_size': 500,
+        'max_attempts': 3,
+        'use_cache': True,
+        'incremental': INCREMENTAL,
+        'separate_responses': SEPARATE_RESPONSES,
+    }
 )
 
 
+if INCREMENTAL:
+    # Incremental runs only move the watermark once the post details are staged
+    commit_watermark_task = PythonOperator(
+        task_id='commit_watermark',
+        dag=chadd_dag,
+        python_callable=commit_watermark,
+    )
+
 fill_members_collection_task = PythonOperator(
     task_id='fill_members_collection_task',
     dag=chadd_dag,
     python_callable=fetch_members_details,
+    op_kwargs={
+        'max_workers': 8,
+        'requests_per_second': 5,
+        'batch_size': 500,
+        'max_attempts': 3,
+        'use_cache': True,
+        'incremental': INCREMENTAL,
+    }
 )
 
 
 # noinspection PyStatementEffect
-check_mongo_task >> branch_mongo_task >> [clean_ingestion_db_task, stop_task]
+check_mongo_task >> branch_mongo_task >> [clean_ingestion_db_task, prepare_ingestion_db_task, stop_task]
 # noinspection PyStatementEffect
-clean_ingestion_db_task >> check_cookie_task >> found_cookies >> [load_scraper_from_cookies, init_scraper_task] >> fetch_posts_task >> fill_posts_collection_task
+[clean_ingestion_db_task, prepare_ingestion_db_task] >> ensure_indexes_task >> check_cookie_task >> found_cookies >> [load_scraper_from_cookies, init_scraper_task] >> fetch_posts_task >> fill_posts_collection_task
 # noinspection PyStatementEffect
 fill_posts_collection_task >> fetch_members_task >> fill_members_collection_task
+if INCREMENTAL:
+    # noinspection PyStatementEffect
+    fill_posts_collection_task >> commit_watermark_task
 
 
 
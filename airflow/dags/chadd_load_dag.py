@@ -5,6 +5,7 @@ from airflow.operators.python_operator import PythonOperator, BranchPythonOperat
 
 from src.chadd_prod_loading import *
 from src.utils.mongo import create_production_db
+from src.utils.indexes import ensure_indexes_func
 from src.reddit_scrapping import connect_to_mongo, test_mongo
 
 
@@ -48,6 +49,13 @@ create_production_db_task = PythonOperator(
     python_callable=create_production_db,
 )
 
+ensure_indexes_task = PythonOperator(
+    task_id='ensure_indexes',
+    dag=chadd_dag,
+    python_callable=ensure_indexes_func,
+    op_kwargs={'databases': ['chadd_staging_db', 'Production_db']},
+)
+
 def branch_on_staging_db_check():
     if check_staging_db():
         return 'create_production_db'
@@ -65,12 +73,16 @@ load_posts_to_prod_db_task = PythonOperator(
     task_id='load_posts_to_prod_db',
     dag=chadd_dag,
     python_callable=load_posts_to_prod_db,
+    # False falls back to the per-post Python migration
+    op_kwargs={'server_side': True},
 )
 
 load_members_to_prod_db_task = PythonOperator(
     task_id='load_members_to_prod_db',
     dag=chadd_dag,
     python_callable=load_members_to_prod_db,
+    # False copies the members in checkpointed chunks instead of a single $merge
+    op_kwargs={'server_side': True, 'chunk_size': 1000},
 )
 
 stop_task = PythonOperator(
@@ -80,7 +92,7 @@ stop_task = PythonOperator(
 )
 
 check_mongo_task >> branch_staging_db_task >> [create_production_db_task, stop_task]
-create_production_db_task >> load_members_to_prod_db_task >> load_posts_to_prod_db_task
+create_production_db_task >> ensure_indexes_task >> load_members_to_prod_db_task >> load_posts_to_prod_db_task
 
 
 
@@ -7,6 +7,7 @@ from airflow.operators.dummy_operator import DummyOperator
 from src.reddit_scrapping import test_mongo
 from src.utils.mongo import connect_to_mongo
 from src.chadd_scraping import *
+from src.utils.indexes import ensure_indexes_func
 
 
 
@@ -23,6 +24,12 @@ chadd_dag = DAG(
     catchup=False,
 )
 
+# Ollama requests in flight per enrichment task, keep it in line with OLLAMA_NUM_PARALLEL in docker-compose.yaml
+OLLAMA_MAX_IN_FLIGHT = 4
+# One post-classifier request per post for the sentiment, self-diagnosis and self-medication labels.
+# False goes back to the separate sentimentizer and selfdiagnosis-detectionizer tasks.
+COMBINED_POST_CLASSIFIER = True
+
 check_mongo_task = PythonOperator(
     task_id='check_mongo_task',
     dag=chadd_dag,
@@ -31,7 +38,7 @@ check_mongo_task = PythonOperator(
 
 def branch_on_mango_connection():
     if connect_to_mongo():
-        return 'infer_gender_task'
+        return 'ensure_indexes'
     else:
         return 'stop_task'
 
@@ -41,6 +48,13 @@ branch_mongo_task = BranchPythonOperator(
     python_callable=branch_on_mango_connection,
 )
 
+ensure_indexes_task = PythonOperator(
+    task_id='ensure_indexes',
+    dag=chadd_dag,
+    python_callable=ensure_indexes_func,
+    op_kwargs={'databases': ['chadd_staging_db', 'llm_cache']},
+)
+
 stop_task = DummyOperator(
     task_id='stop_task',
     dag=chadd_dag,
@@ -56,6 +70,7 @@ infer_gender_task = PythonOperator(
     task_id='infer_gender_task',
     dag=chadd_dag,
     python_callable=infer_gender_from_bio,
+    op_kwargs={'max_in_flight': OLLAMA_MAX_IN_FLIGHT},
 )
 
 homogenize_gender_task = PythonOperator(
@@ -64,17 +79,27 @@ homogenize_gender_task = PythonOperator(
     python_callable = homogenize_gender,
 )
 
-analyze_sentiment_task = PythonOperator(
-    task_id = 'analyze_sentiment_task',
-    dag = chadd_dag,
-    python_callable = analyze_sentiment,
-)
+if COMBINED_POST_CLASSIFIER:
+    classify_posts_task = PythonOperator(
+        task_id = 'classify_posts_task',
+        dag = chadd_dag,
+        python_callable = classify_posts,
+        op_kwargs = {'max_in_flight': OLLAMA_MAX_IN_FLIGHT},
+    )
+else:
+    analyze_sentiment_task = PythonOperator(
+        task_id = 'analyze_sentiment_task',
+        dag = chadd_dag,
+        python_callable = analyze_sentiment,
+        op_kwargs = {'max_in_flight': OLLAMA_MAX_IN_FLIGHT},
+    )
 
-classify_self_diagnosis_and_medication_task = PythonOperator(
-    task_id = 'classify_self_diagnosis_and_medication_task',
-    dag = chadd_dag,
-    python_callable = classify_self_diagnosis_and_medication,
-)
+    classify_self_diagnosis_and_medication_task = PythonOperator(
+        task_id = 'classify_self_diagnosis_and_medication_task',
+        dag = chadd_dag,
+        python_callable = classify_self_diagnosis_and_medication,
+        op_kwargs = {'max_in_flight': OLLAMA_MAX_IN_FLIGHT},
+    )
 
 
 
@@ -82,8 +107,11 @@ classify_self_diagnosis_and_medication_task = PythonOperator(
 # check mongo connection
 # infer gender
 # homogenize gender
-# analyze sentiment
-# classify self diagnosis and medication
-
-check_mongo_task >> branch_mongo_task >> [infer_gender_task, stop_task]
-infer_gender_task >>homogenize_gender_task >> analyze_sentiment_task >> classify_self_diagnosis_and_medication_task
\ No newline at end of file
+# analyze sentiment, classify self diagnosis and medication (in one pass with the combined classifier)
+
+check_mongo_task >> branch_mongo_task >> [ensure_indexes_task, stop_task]
+ensure_indexes_task >> infer_gender_task >>homogenize_gender_task
+if COMBINED_POST_CLASSIFIER:
+    homogenize_gender_task >> classify_posts_task
+else:
+    homogenize_gender_task >> analyze_sentiment_task >> classify_self_diagnosis_and_medication_task
\ No newline at end of file
@@ -1,7 +1,10 @@
 from airflow import DAG
 from airflow.operators.bash import BashOperator
+from airflow.operators.python import PythonOperator
 from datetime import datetime
 
+from src.utils.mongo import migrate_to_native_types
+
 # DAG definition
 default_args = {
     'owner': 'airflow',
@@ -56,4 +59,11 @@ with DAG(
         """
     )
 
-    migrate_mongodb 
\ No newline at end of file
+    # Restored dumps may still hold dates as ISO strings and IDs as strings
+    migrate_native_types_task = PythonOperator(
+        task_id='migrate_native_types',
+        python_callable=migrate_to_native_types,
+        op_kwargs={'batch_size': 1000},
+    )
+
+    migrate_mongodb >> migrate_native_types_task
@@ -4,6 +4,7 @@ from airflow import DAG
 from airflow.operators.python_operator import PythonOperator
 from src.augmenting_data import augment_documents,clean_data
 from src.reddit_scrapping import  get_reddit_posts
+from src.utils.indexes import ensure_indexes_func
 
 import os
 from datetime import datetime, timedelta  # Import timedelta here
@@ -48,6 +49,13 @@ def Clean():
 
 
 
+ensure_indexes_task = PythonOperator(
+    task_id='ensure_indexes',
+    dag=reddit_dag,
+    python_callable=ensure_indexes_func,
+    op_kwargs={'databases': ['Ingestion_db', 'Staging_db', 'Production_db', 'llm_cache']},
+)
+
 task_zero = PythonOperator(
     task_id='Scrap_reddit_posts',
     dag=reddit_dag,
@@ -86,5 +94,5 @@ task_two = PythonOperator(
 #----------------------
 
 
-task_zero >> task_one >> task_two
+ensure_indexes_task >> task_zero >> task_one >> task_two
 
@@ -1,14 +1,18 @@
 import os
+import json
 from dotenv import load_dotenv
 import praw
 import redis
-from pymongo import MongoClient, errors
+from pymongo import errors
 import re
 import datetime
 import pandas as pd
 import datetime
 import requests
 
+from src.utils.llm_cache import LLMCache
+from src.utils.mongo_client import get_client
+
 
 
 
@@ -18,7 +22,7 @@ def test_mongo():
 
     try:
         print('working_directory:', os.getcwd())
-        client = MongoClient("mongodb://mongo:27017/")  # Replace with your URI
+        client = get_client()
         client.server_info()  # Force connection to the server
         print("Connected to MongoDB!")
     except errors.ServerSelectionTimeoutError as err:
@@ -32,14 +36,10 @@ def connect_to_mongo():
     print(os.getcwd())
          
    
-      # MongoDB connection details
-    mongo_host = 'mongo'  # Docker service name for MongoDB
-    mongo_port = 27017
-
     try:
         # Establish connection to MongoDB
         print('connecting to mongo')
-        client = MongoClient("mongodb://mongo:27017/")  # Replace with your URI
+        client = get_client()
         client.server_info()  # Force connection to the server
 
     
@@ -63,6 +63,9 @@ def augment_documents(limit):
     db_ingestion=client['Ingestion_db']
     db_staging=client['Staging_db']
     documents=get_documents(db_ingestion, 'reddit_ingestion', limit)
+    # Every request counts against the daily quota of the API, prompts already answered are not sent again
+    cache=LLMCache()
+    fingerprint=cache.fingerprint(MISTRAL_MODEL, json.dumps(MISTRAL_PARAMETERS, sort_keys=True))
     answer_nb=0
     error_nb=0
     total=0
@@ -75,12 +78,15 @@ def augment_documents(limit):
         text=document['self_text']
         try:
             prompt=create_prompt(title, text)
-            response_mistrale=get_mistral_response(prompt)
-            response=augmented_json_data(response_mistrale)
-            if response['Sentiment']=='[answer]':
-                print(f"Error [answer] processing document with id: {id}")
-                answer_nb+=1
-                continue
+            response=cache.get(fingerprint, prompt)
+            if response is None:
+                response_mistrale=get_mistral_response(prompt)
+                response=augmented_json_data(response_mistrale)
+                if response['Sentiment']=='[answer]':
+                    print(f"Error [answer] processing document with id: {id}")
+                    answer_nb+=1
+                    continue
+                cache.put(fingerprint, prompt, MISTRAL_MODEL, response)
             db_staging.reddit_llm.insert_one(document)
             db_staging.reddit_llm.update_one({'id': id}, {'$set': response})
             db_ingestion.reddit_ingestion.update_one({'id': id}, {'$set': {'staged': 1}})
@@ -91,6 +97,8 @@ def augment_documents(limit):
             print(e)
             error_nb+=1
     
+    cache.report('augment_documents')
+
     if total==0:
         print("No documents to process")
         return False
@@ -206,13 +214,19 @@ def augmented_json_data(text):
 
     
 
+MISTRAL_MODEL = "mistralai/Mistral-7B-Instruct-v0.3"
+MISTRAL_PARAMETERS = {
+    "max_new_tokens": 256,
+    "temperature": 0.7
+}
+
 def get_mistral_response(prompt):
     
         # Replace with your Hugging Face API token
     HUGGING_FACE_API_TOKEN = os.getenv("Mistrale_Token")
 
     # The API endpoint for the Mistral model
-    API_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.3"
+    API_URL = f"https://api-inference.huggingface.co/models/{MISTRAL_MODEL}"
 
     #Limit to 1000 requests per day hence 1000 document per day 
 
@@ -225,10 +239,7 @@ def get_mistral_response(prompt):
     # Data to send to the model
     data = {
         "inputs": prompt,
-        "parameters": {
-            "max_new_tokens": 256,
-            "temperature": 0.7
-        }
+        "parameters": MISTRAL_PARAMETERS
     }
 
     # Send the POST request
@@ -287,8 +298,8 @@ def get_year(datetime):
     return datetime.year
 
 def get_utc_time(timestamp):
-    # Convert timestamp to UTC datetime
-    utc_time = datetime.datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S')
+    # Convert timestamp to a naive UTC datetime, stored as a BSON date
+    utc_time = datetime.datetime.utcfromtimestamp(timestamp)
     return utc_time
 
 def fix_gender_errors(text):
@@ -327,6 +338,7 @@ def clean_df(posts_registered_df):
     
     # fix the date format
     posts_registered_df['created_at']=posts_registered_df['created_at'].apply(get_utc_time)
+    # The column becomes datetime64, its Timestamp values are stored by pymongo as BSON dates
     
     # keep the necessary columns
     list_col_porduction=['id', 'created_at', 'Gender','Self-Diagnosis',
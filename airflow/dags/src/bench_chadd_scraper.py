@@ -0,0 +1,111 @@
+"""
+Throughput benchmark of ChaddScraper against the local mock HealthUnlocked server.
+
+Run from airflow/dags:
+    python -m src.bench_chadd_scraper --latency 0.05 --workers 1 8 32
+"""
+import argparse
+import contextlib
+import io
+import resource
+import time
+
+from src.chadd.chadd_scrap import ChaddScraper
+from src.chadd.mock_server import MockHealthUnlockedServer
+from src.utils.rate_limiter import RateLimiter
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, q) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def make_scraper(server, rate_limited: bool, max_workers: int) -> ChaddScraper:
+    rate_limiter = RateLimiter(rate=10000, burst=max_workers, max_concurrency=max_workers) if rate_limited else None
+    scraper = ChaddScraper(email='bench@example.com', password='bench', base_url=server.url, rate_limiter=rate_limiter)
+    scraper.login()
+    return scraper
+
+
+def run(name, scraper, call, verbose=False) -> dict:
+    latencies = []
+
+    def record(response, *args, **kwargs):
+        latencies.append(response.elapsed.total_seconds())
+
+    scraper.session.hooks['response'].append(record)
+    # The scraper logs every request, which would drown the results
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    started_at = time.perf_counter()
+    with output:
+        call()
+    elapsed = time.perf_counter() - started_at
+    scraper.session.hooks['response'].remove(record)
+
+    return {
+        'benchmark': name,
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'requests/s': len(latencies) / elapsed if elapsed else 0.0,
+        'p50 ms': percentile(latencies, 0.50) * 1000,
+        'p99 ms': percentile(latencies, 0.99) * 1000,
+        'peak RSS MB': peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.02, help='server latency per request, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of a 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='probability of a 429')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8], help='max_workers values to compare')
+    parser.add_argument('--posts', type=int, default=200, help='number of post details to fetch')
+    parser.add_argument('--users', type=int, default=200, help='number of user profiles to fetch')
+    parser.add_argument('--members', type=int, default=1200, help='number of members in the community')
+    parser.add_argument('--start-date', default='2018-01')
+    parser.add_argument('--end-date', default='2024-12')
+    parser.add_argument('--verbose', action='store_true', help='show the scraper logs')
+    args = parser.parse_args()
+
+    # Retries are needed as soon as the server fails some requests
+    rate_limited = args.error_rate > 0 or args.throttle_rate > 0
+
+    results = []
+
+    def bench(name, scraper, call):
+        results.append(run(name, scraper, call, args.verbose))
+
+    with MockHealthUnlockedServer(latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                                  retry_after=0.1, total_members=args.members) as server:
+        for workers in args.workers:
+            with contextlib.redirect_stdout(io.StringIO()):
+                scraper = make_scraper(server, rate_limited, workers)
+            post_ids = [150000000 + i for i in range(args.posts)]
+            usernames = [f'BenchUser{i}' for i in range(args.users)]
+
+            bench(f'get_posts_ids x{workers}', scraper, lambda: scraper.get_posts_ids(
+                args.start_date, args.end_date, max_workers=workers))
+            bench(f'get_post_details x{workers}', scraper, lambda: list(scraper.iter_post_details(
+                post_ids, max_workers=workers)))
+            bench(f'get_user_details x{workers}', scraper, lambda: list(scraper.iter_user_details(
+                usernames, max_workers=workers)))
+            bench(f'get_all_members x{workers}', scraper, lambda: scraper.get_all_members(
+                max_workers=workers))
+
+    columns = ['benchmark', 'requests', 'seconds', 'requests/s', 'p50 ms', 'p99 ms', 'peak RSS MB']
+    print()
+    print(' | '.join([f'{columns[0]:<26}'] + [f'{column:>11}' for column in columns[1:]]))
+    for result in results:
+        print(' | '.join([f'{result["benchmark"]:<26}', f'{result["requests"]:>11d}']
+                         + [f'{result[column]:>11.1f}' for column in columns[2:]]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Decode microbenchmark: raw post payloads to Post objects, with the stdlib path
+(json.loads and strptime) against the fast path (orjson when installed and fromisoformat).
+
+Run from airflow/dags:
+    python -m src.bench_json_decode --posts 2000 --responses 20
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+import src.chadd.models.post as post_module
+from src.bench_models_memory import make_payloads
+from src.chadd.models.post import Post
+from src.utils.fast_json import HEALTHUNLOCKED_DATE_FORMAT, JSON_BACKEND, loads, parse_iso_datetime
+
+
+def best_of(repeat: int, call) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings)
+
+
+def stdlib_path(raw_payloads: list) -> list:
+    # What the scraper did before: response.json() then strptime for every timestamp
+    parse = post_module.parse_iso_datetime
+    post_module.parse_iso_datetime = lambda value: datetime.strptime(value, HEALTHUNLOCKED_DATE_FORMAT)
+    try:
+        return [Post.from_json(json.loads(raw)) for raw in raw_payloads]
+    finally:
+        post_module.parse_iso_datetime = parse
+
+
+def fast_path(raw_payloads: list) -> list:
+    return Post.from_json_list(loads(raw) for raw in raw_payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=2000, help='number of posts to decode')
+    parser.add_argument('--responses', type=int, default=20, help='number of responses per post')
+    parser.add_argument('--authors', type=int, default=500, help='number of distinct authors')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs, the best one is kept')
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.posts, args.responses, args.authors)
+    raw_payloads = [json.dumps(payload).encode() for payload in payloads]
+    timestamps = [response['dateCreated'] for payload in payloads for response in payload['responses']]
+
+    assert [post.to_dict() for post in stdlib_path(raw_payloads)] == [post.to_dict() for post in fast_path(raw_payloads)]
+
+    rows = [
+        ('json.loads', best_of(args.repeat, lambda: [json.loads(raw) for raw in raw_payloads]), args.posts),
+        (f'fast_json.loads ({JSON_BACKEND})', best_of(args.repeat, lambda: [loads(raw) for raw in raw_payloads]), args.posts),
+        ('strptime', best_of(args.repeat, lambda: [datetime.strptime(value, HEALTHUNLOCKED_DATE_FORMAT)
+                                                   for value in timestamps]), len(timestamps)),
+        ('parse_iso_datetime', best_of(args.repeat, lambda: [parse_iso_datetime(value) for value in timestamps]),
+         len(timestamps)),
+        ('bytes to Post, stdlib', best_of(args.repeat, lambda: stdlib_path(raw_payloads)), args.posts),
+        ('bytes to Post, fast', best_of(args.repeat, lambda: fast_path(raw_payloads)), args.posts),
+    ]
+
+    print(f'{args.posts} posts with {args.responses} responses each, best of {args.repeat} runs')
+    print(f'{"step":<32} | {"seconds":>9} | {"items/s":>11}')
+    for name, seconds, items in rows:
+        print(f'{name:<32} | {seconds:>9.3f} | {items / seconds:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Memory footprint of the CHADD models, in bytes per parsed post.
+
+Posts are built from the recorded fixture, with responses spread over a pool of recurring
+authors like in the real community. The current models (__slots__, shared response authors)
+are compared with a baseline of plain __dict__ classes holding the same fields, with one
+author instance per response like the models had before. Run from airflow/dags:
+    python -m src.bench_models_memory --posts 2000 --responses 20
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import tracemalloc
+
+from src.chadd.mock_server import FIXTURES_DIR
+from src.chadd.models.post import Post
+from src.utils.fast_json import parse_iso_datetime
+
+
+class BaselineUser:
+    def __init__(self, user_id, username, age=None, gender=None, country=None, bio=None, conditions=None):
+        self.user_id = user_id
+        self.username = username
+        self.age = age
+        self.gender = gender
+        self.country = country
+        self.bio = bio
+        self.conditions = conditions or []
+
+
+class BaselineResponse:
+    def __init__(self, response_id, author, body, date_created):
+        self.response_id = response_id
+        self.author = author
+        self.body = body
+        self.date_created = date_created
+
+
+class BaselinePost:
+    def __init__(self, post_id, title, body, author, date_created, total_responses, responses=None):
+        self.post_id = post_id
+        self.title = title
+        self.body = body
+        self.author = author
+        self.date_created = date_created
+        self.total_responses = total_responses
+        self.responses = responses or []
+
+    @classmethod
+    def from_json(cls, api_response: dict) -> 'BaselinePost':
+        author_data = api_response.get("author", {})
+        responses = [
+            BaselineResponse(
+                response_id=response_data.get("id"),
+                author=BaselineUser(user_id=response_data.get("author", {}).get("id"),
+                                    username=response_data.get("author", {}).get("username")),
+                body=response_data.get("body"),
+                date_created=parse_iso_datetime(response_data.get("dateCreated")),
+            )
+            for response_data in api_response.get("responses", [])
+        ]
+        return cls(
+            post_id=api_response.get("id"),
+            title=api_response.get("title"),
+            body=api_response.get("body"),
+            author=BaselineUser(user_id=author_data.get("id"), username=author_data.get("username"),
+                                age=author_data.get("age"), gender=author_data.get("gender"),
+                                country=author_data.get("country"), bio=author_data.get("bio")),
+            date_created=parse_iso_datetime(api_response.get("dateCreated")),
+            total_responses=api_response.get("totalResponses", 0),
+            responses=responses,
+        )
+
+
+def make_payloads(posts: int, responses: int, authors: int) -> list:
+    with open(os.path.join(FIXTURES_DIR, 'post.json'), 'r') as f:
+        template = json.load(f)
+
+    payloads = []
+    for i in range(posts):
+        payload = copy.deepcopy(template)
+        payload['id'] = 150000000 + i
+        payload['author'] = dict(template['author'], id=1000 + i % authors, username=f'Author{i % authors}')
+        payload['responses'] = []
+        for j in range(responses):
+            response = copy.deepcopy(template['responses'][j % len(template['responses'])])
+            author_index = (i * 7 + j * 13) % authors
+            response['id'] = 7000000 + i * responses + j
+            response['author'] = {'id': 1000 + author_index, 'username': f'Author{author_index}'}
+            payload['responses'].append(response)
+        payload['totalResponses'] = responses
+        payloads.append(payload)
+
+    return payloads
+
+
+def measure(payloads: list, model=Post) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    posts = [model.from_json(payload) for payload in payloads]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert len(posts) == len(payloads)
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=2000, help='number of posts to parse')
+    parser.add_argument('--responses', type=int, default=20, help='number of responses per post')
+    parser.add_argument('--authors', type=int, default=500, help='number of distinct authors')
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.posts, args.responses, args.authors)
+
+    print(f'{args.posts} posts with {args.responses} responses each, {args.authors} distinct authors')
+    totals = {}
+    for name, model in (('baseline', BaselinePost), ('current', Post)):
+        totals[name] = total = measure(payloads, model)
+        print(f'{name:>8}: {total / 1024 / 1024:.1f} MB in total, {total / args.posts:.0f} bytes per post, '
+              f'{total / (args.posts * (args.responses + 1)):.0f} bytes per post or response')
+    print(f'current / baseline: {totals["current"] / totals["baseline"]:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,41 @@
 from datetime import timedelta, datetime
-from typing import Optional, List
+from typing import Iterable, Iterator, Optional, List
 
 import requests
 import json
 import os
+import time
+
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
 
 from src.chadd.models.user import User
 from src.chadd.models.post import Post
+from src.utils.concurrency import imap_concurrently, map_concurrently
+from src.utils.fast_json import loads
+from src.utils.http_cache import ResponseCache
+from src.utils.rate_limiter import RateLimiter
 
 
 class ChaddScraper:
-    def __init__(self, email: Optional[str], password: Optional[str], base_url = 'https://healthunlocked.com'):
+    # Number of members returned by one page of the /private/members listing
+    MEMBERS_PAGE_SIZE = 12
+
+    def __init__(self, email: Optional[str], password: Optional[str], base_url = 'https://healthunlocked.com',
+                 cache: Optional[ResponseCache] = None, rate_limiter: Optional[RateLimiter] = None):
         """
         Initialize the scraper with user credentials and the base URL of the website.
 
         :param email: Your login email
         :param password: Your login password
         :param base_url: The base URL of the website (e.g. 'https://healthunlocked.com/')
+        :param cache: An optional persistent cache for the responses of the detail endpoints
+        :param rate_limiter: An optional rate limiter throttling and retrying the requests, can be shared between scrapers
         """
         self.email = email
         self.password = password
         self.base_url = base_url
+        self.cache = cache
+        self.rate_limiter = rate_limiter
 
         # A requests.Session object will help persist cookies between requests
         self.session = requests.Session()
@@ -30,14 +45,20 @@ class ChaddScraper:
         self.huLang = None
         self.huSessID = None
 
+        # Set by SessionManager.get_scraper, used to renew the session when it expires mid-run
+        self.session_manager = None
+
     @classmethod
-    def from_cookies(cls, cookies: dict) -> 'ChaddScraper':
+    def from_cookies(cls, cookies: dict, cache: Optional[ResponseCache] = None,
+                     rate_limiter: Optional[RateLimiter] = None) -> 'ChaddScraper':
         """
         Initialize the scraper with cookies instead of credentials.
 
         :param cookies: A dictionary containing the cookies to use
+        :param cache: An optional persistent cache for the responses of the detail endpoints
+        :param rate_limiter: An optional rate limiter throttling and retrying the requests
         """
-        scraper = cls(email=None, password=None)
+        scraper = cls(email=None, password=None, cache=cache, rate_limiter=rate_limiter)
         scraper.huBv = cookies.get("huBv", None)
         scraper.huSessID = cookies.get("huSessID", None)
         return scraper
@@ -99,6 +120,30 @@ class ChaddScraper:
         print("Login successful! 😊😊")
 
 
+    def get_cookies(self) -> dict:
+        """
+        Get the cookies needed to reuse the current session.
+        """
+        return {
+            "huBv": self.huBv,
+            "huSessID": self.huSessID
+        }
+
+    def apply_cookies(self, cookies: dict) -> None:
+        """
+        Use previously saved cookies for the next requests.
+
+        :param cookies: A dictionary containing the cookies to use
+        """
+        # Update the class attributes
+        self.huBv = cookies.get("huBv", None)
+        self.huSessID = cookies.get("huSessID", None)
+
+        # Also update the session’s cookie jar for subsequent requests
+        for name, value in cookies.items():
+            if value is not None:
+                self.session.cookies.set(name, value)
+
     def save_cookies_to_file(self, filename: str = "cookies.json") -> None:
         """
         Persist the currently stored cookies to a local JSON file so that they
@@ -106,10 +151,7 @@ class ChaddScraper:
 
         :param filename: Name of the JSON file where cookies will be saved
         """
-        cookies_data = {
-            "huBv": self.huBv,
-            "huSessID": self.huSessID
-        }
+        cookies_data = self.get_cookies()
 
         with open(filename, "w") as f:
             json.dump(cookies_data, f)
@@ -117,49 +159,136 @@ class ChaddScraper:
             print(f"Cookies saved to {os.path.abspath(filename)}")
 
     @classmethod
-    def from_config(cls, filename: str = "cookies.json") -> 'ChaddScraper':
+    def from_config(cls, filename: str = "cookies.json", cache: Optional[ResponseCache] = None,
+                    rate_limiter: Optional[RateLimiter] = None) -> 'ChaddScraper':
         """
         (Optional) Load previously saved cookies from a local JSON file.
         This method can be handy if you want to avoid logging in again.
 
         :param filename: Name of the JSON file where cookies are stored
+        :param cache: An optional persistent cache for the responses of the detail endpoints
+        :param rate_limiter: An optional rate limiter throttling and retrying the requests
         """
 
-        scraper = cls(email=None, password=None)
+        scraper = cls(email=None, password=None, cache=cache, rate_limiter=rate_limiter)
         if os.path.exists(filename):
             with open(filename, "r") as f:
                 cookies_data = json.load(f)
 
-            # Update the class attributes
-            scraper.huBv = cookies_data.get("huBv", None)
-            scraper.huSessID = cookies_data.get("huSessID", None)
-
-            # Also update the session’s cookie jar for subsequent requests
-            for name, value in cookies_data.items():
-                if value is not None:
-                    scraper.session.cookies.set(name, value)
+            scraper.apply_cookies(cookies_data)
 
         else:
             print(f"No cookie file found at {filename}. Please log in first.")
 
         return scraper
 
-    def get_posts_ids(self, start_date = '2017-07', end_date = '2025-01', community = 'adult-adhd') -> list:
+    def get_posts_ids(self, start_date = '2017-07', end_date = '2025-01', community = 'adult-adhd',
+                      max_workers: int = 1, retries: int = 3) -> list:
         """
         Get all the posts ids for a given community and a given range of years and months.
 
         :param community: The community for which we want to get the posts
         :param start_date: The start date of the range
         :param end_date: The end date of the range
-        :return: A list of posts ids
+        :param max_workers: The maximum number of monthly listings requested at the same time
+        :param retries: The number of attempts for a month before giving up on it
+        :return: A list of posts ids, without duplicates, ordered by month
+        :raises Exception: If some months still failed after all the retries
+        """
+        posts_by_month = self.get_posts_ids_by_month(start_date, end_date, community, max_workers, retries)
+
+        # A month missing from the listing would silently drop its posts
+        failed_months = [month for month, month_ids in posts_by_month.items() if month_ids is None]
+        if failed_months:
+            raise Exception(f"Failed to fetch posts for {', '.join(failed_months)} after {retries} attempts")
+
+        posts_ids = []
+        seen = set()
+        for month, month_ids in posts_by_month.items():
+            for post_id in month_ids:
+                if post_id not in seen:
+                    seen.add(post_id)
+                    posts_ids.append(post_id)
+
+        print(f"Total posts fetched: {len(posts_ids)}")
+        return posts_ids
+
+    def get_posts_ids_by_month(self, start_date = '2017-07', end_date = '2025-01', community = 'adult-adhd',
+                               max_workers: int = 1, retries: int = 3) -> dict:
         """
+        Get the posts ids of every month in the range. The monthly listings are requested
+        concurrently, and a month that fails is retried on its own without stopping the others.
 
+        :param community: The community for which we want to get the posts
+        :param start_date: The start date of the range
+        :param end_date: The end date of the range
+        :param max_workers: The maximum number of monthly listings requested at the same time
+        :param retries: The number of attempts for a month before giving up on it
+        :return: A dictionary mapping 'YYYY-MM' to the list of posts ids of that month, in month order.
+                 The value is None for the months that still failed after all the retries.
+        """
         if not self.huSessID:
             raise Exception("Please log in first. Execute ChaddScraper.login() first.")
 
-        posts_ids = []
-        base_url = f"{self.base_url}/private/posts/{community}/latest?"
+        months = self._month_range(start_date, end_date)
+        posts_by_month = {month.strftime("%Y-%m"): None for month in months}
+
+        self._resize_connection_pool(max_workers)
+        pending = months
+        for attempt in range(1, retries + 1):
+            results = map_concurrently(lambda month: self._fetch_posts_ids_for_month(community, month.year, month.month),
+                                       pending, max_workers=max_workers)
+            pending = []
+            for month, month_ids, error in results:
+                if error is not None:
+                    print(f"Attempt {attempt}/{retries} failed for {month.strftime('%Y-%m')}: {error}")
+                    pending.append(month)
+                else:
+                    posts_by_month[month.strftime("%Y-%m")] = month_ids
+
+            if not pending:
+                break
+            if attempt < retries:
+                time.sleep(2 ** attempt)
+
+        for month in pending:
+            print(f"Giving up on {month.strftime('%Y-%m')} after {retries} attempts.")
+
+        return posts_by_month
+
+    def _fetch_posts_ids_for_month(self, community, year, month) -> list:
+        """
+        Helper method to fetch the posts ids listed for a single month.
+
+        :param community: The community for which we want to get the posts
+        :param year: The year of the listing
+        :param month: The month of the listing
+        :return: A list of posts ids
+        """
+        print(f"Fetching posts for {year}-{month}...")
+
+        url = f"{self.base_url}/private/posts/{community}/latest?year={year}&month={month}"
+        response = self._get(url)
 
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch posts for {year}-{month}")
+
+        try:
+            data = loads(response.content)
+            return [post['postId'] for post in data if "postId" in post]
+        except Exception as e:
+            print(f"Error processing response for {year}-{month}: {e}")
+            return []
+
+    @staticmethod
+    def _month_range(start_date: str, end_date: str) -> List[datetime]:
+        """
+        List the first day of every month between two 'YYYY-MM' dates, both included.
+
+        :param start_date: The start date of the range
+        :param end_date: The end date of the range
+        :return: A list of datetimes
+        """
         # If date formats are not respected, raise an exception
         if len(start_date) != 7 or len(end_date) != 7:
             raise Exception("Date format must be YYYY-MM.")
@@ -167,35 +296,17 @@ class ChaddScraper:
         start_date = datetime.strptime(start_date, "%Y-%m")
         end_date = datetime.strptime(end_date, "%Y-%m")
 
-
         if start_date > end_date:
             raise Exception("Start date must be before end date.")
 
+        months = []
         current_date = start_date
         while current_date <= end_date:
-            year = current_date.year
-            month = current_date.month
-
-            print(f"Fetching posts for {year}-{month}...")
-
-            url = f"{base_url}year={year}&month={month}"
-            response = self.session.get(url)
-
-            if response.status_code != 200:
-                raise Exception(f"Failed to fetch posts for {year}-{month}")
-
-            try:
-                data = response.json()
-                posts_ids.extend(post['postId'] for post in data if "postId" in post)
-
-            except Exception as e:
-                print(f"Error processing response for {year}-{month}: {e}")
-
+            months.append(current_date)
             next_month = current_date.replace(day=28) + timedelta(days=4)
             current_date = next_month.replace(day=1)
 
-        print(f"Total posts fetched: {len(posts_ids)}")
-        return posts_ids
+        return months
 
     def get_post_details(self, post_id, community = 'adult-adhd') -> Post:
         """
@@ -209,14 +320,44 @@ class ChaddScraper:
             raise Exception("Please log in first. Execute ChaddScraper.login() first.")
 
         url = f"{self.base_url}/private/posts/{community}/{post_id}"
-        response = self.session.get(url)
+        response = self._get(url)
 
         if response.status_code != 200:
             raise Exception(f"Failed to fetch post details for post ID {post_id}")
 
-        post_object = response.json()
+        post_object = loads(response.content)
         return Post.from_json(post_object)
 
+    def get_posts_details(self, post_ids: List[int], community = 'adult-adhd', max_workers: int = 8) -> list:
+        """
+        Get the details of several posts, fetching up to max_workers posts at the same time
+        over the shared session.
+
+        :param post_ids: The IDs of the posts
+        :param community: The community of the posts
+        :param max_workers: The maximum number of requests in flight
+        :return: A list of (post_id, post, error) tuples in the same order as post_ids.
+                 post is None when the fetch failed, and error holds the raised exception.
+        """
+        return list(self.iter_post_details(post_ids, community, max_workers))
+
+    def iter_post_details(self, post_ids: Iterable[int], community = 'adult-adhd', max_workers: int = 8) -> Iterator[tuple]:
+        """
+        Lazy version of get_posts_details: post IDs are consumed and posts are yielded as they are fetched,
+        so only a handful of posts are held in memory at any time.
+
+        :param post_ids: The IDs of the posts, can be a generator
+        :param community: The community of the posts
+        :param max_workers: The maximum number of requests in flight
+        :return: An iterator of (post_id, post, error) tuples in the same order as post_ids
+        """
+        if not self.huSessID:
+            raise Exception("Please log in first. Execute ChaddScraper.login() first.")
+
+        self._resize_connection_pool(max_workers)
+        return imap_concurrently(lambda post_id: self.get_post_details(post_id, community),
+                                 post_ids, max_workers=max_workers)
+
     @staticmethod
     def save_post_to_file(post: Post, filename: str = "post.json") -> None:
         """
@@ -226,7 +367,7 @@ class ChaddScraper:
         :param filename: The name of the JSON file where the post will be saved
         """
         with open(filename, "w") as f:
-            json.dump(post.to_dict(), f)
+            json.dump(post.to_dict(), f, default=datetime.isoformat)
 
     @staticmethod
     def save_posts_to_file(posts: List[Post], filename: str = "posts.json") -> None:
@@ -237,7 +378,7 @@ class ChaddScraper:
         :param filename: The name of the JSON file where posts will be saved
         """
         with open(filename, "w") as f:
-            json.dump([post.to_dict() for post in posts], f)
+            json.dump([post.to_dict() for post in posts], f, default=datetime.isoformat)
 
 
     def get_user_details(self, username):
@@ -254,15 +395,31 @@ class ChaddScraper:
             raise Exception("Please provide a valid username.")
 
         url = f"{self.base_url}/private/user/profile/{username}"
-        response = self.session.get(url)
+        response = self._get(url)
 
         if response.status_code != 200:
             raise Exception(f"Failed to fetch user details for username {username}")
 
-        user_object = response.json()
+        user_object = loads(response.content)
         user = User.from_json(user_object)
         return user
 
+    def iter_user_details(self, usernames: Iterable[str], max_workers: int = 8) -> Iterator[tuple]:
+        """
+        Get the details of several users, fetching up to max_workers profiles at the same time.
+        Users are yielded as they are fetched, so only a handful of them are held in memory.
+
+        :param usernames: The usernames of the users, can be a generator
+        :param max_workers: The maximum number of requests in flight
+        :return: An iterator of (username, user, error) tuples in the same order as usernames.
+                 user is None when the fetch failed, and error holds the raised exception.
+        """
+        if not self.huSessID:
+            raise Exception("Please log in first. Execute ChaddScraper.login() first.")
+
+        self._resize_connection_pool(max_workers)
+        return imap_concurrently(self.get_user_details, usernames, max_workers=max_workers)
+
     @staticmethod
     def save_users_to_file(users: List[User], filename: str = "users.json") -> None:
         """
@@ -285,37 +442,92 @@ class ChaddScraper:
         if not self.huSessID:
             raise Exception("Please log in first. Execute ChaddScraper.login() first.")
 
-        start = 12
-        base_url = f"{self.base_url}/private/members/{community}"
-        url = f"{base_url}?start={start * page}"
+        url = self._members_page_url(community, self.MEMBERS_PAGE_SIZE * page)
 
         print(f"Fetching members for page {page}...")
         return self._fetch_members_for_page(url)
 
 
-    def get_all_members(self, community='adult-adhd'):
+    def get_all_members(self, community='adult-adhd', max_workers: int = 1):
         """
-        Get all the members of a community.
+        Get all the members of a community. The last page of the listing is located first,
+        then the pages are fetched concurrently, stopping at the first empty page.
 
         :param community: The community for which we want to get the members
+        :param max_workers: The maximum number of pages requested at the same time
         :return: A list of usernames
         """
         if not self.huSessID:
             raise Exception("Please log in first. Execute ChaddScraper.login() first.")
 
-        start = 12
-        base_url = f"{self.base_url}/private/members/{community}"
+        started_at = time.time()
+        last_start = self._find_last_members_start(community)
+        if last_start is None:
+            print("No members found.")
+            return []
 
-        # Fetch total number of members
+        page_size = self.MEMBERS_PAGE_SIZE
+        starts = list(range(0, last_start + page_size, page_size))
+        print(f"Found {len(starts)} pages of members.")
 
+        self._resize_connection_pool(max_workers)
         members = []
-        for page in range(0, 9980, 12):
-            url = f"{base_url}?start={page}"
-            members.extend(self._fetch_members_for_page(url))
-
-        print(f"Total members fetched: {len(members)}")
+        pages = 0
+        reached_end = False
+        for i in range(0, len(starts), max(max_workers, 1)):
+            chunk = starts[i:i + max(max_workers, 1)]
+            results = map_concurrently(lambda start: self._fetch_members_for_page(self._members_page_url(community, start)),
+                                       chunk, max_workers=max_workers)
+            for start, page_members, error in results:
+                if error is not None:
+                    raise error
+                pages += 1
+                if not page_members:
+                    reached_end = True
+                    break
+                members.extend(page_members)
+
+            if reached_end:
+                break
+
+        elapsed = max(time.time() - started_at, 1e-9)
+        print(f"Total members fetched: {len(members)} from {pages} pages in {elapsed:.1f}s "
+              f"({pages / elapsed:.1f} pages/s, {len(members) / elapsed:.1f} members/s)")
         return members
 
+    def _find_last_members_start(self, community='adult-adhd') -> Optional[int]:
+        """
+        Locate the start offset of the last non-empty members page. The offset is doubled
+        until an empty page is found, then narrowed down with a binary search.
+
+        :param community: The community for which we want to get the members
+        :return: The start offset of the last non-empty page, or None if the community has no members
+        """
+        page_size = self.MEMBERS_PAGE_SIZE
+
+        def has_members(page):
+            return len(self._fetch_members_for_page(self._members_page_url(community, page * page_size))) > 0
+
+        if not has_members(0):
+            return None
+
+        # Exponential search for a page past the end
+        low, high = 0, 1
+        while has_members(high):
+            low, high = high, high * 2
+
+        # Binary search for the last page with members, between low (non-empty) and high (empty)
+        while high - low > 1:
+            middle = (low + high) // 2
+            if has_members(middle):
+                low = middle
+            else:
+                high = middle
+
+        return low * page_size
+
+    def _members_page_url(self, community, start) -> str:
+        return f"{self.base_url}/private/members/{community}?start={start}"
 
     def _fetch_members_for_page(self, url):
         """
@@ -324,19 +536,91 @@ class ChaddScraper:
         :param url: The URL to fetch members from
         :return: A list of usernames
         """
-        response = self.session.get(url)
+        response = self._get(url)
 
         if response.status_code != 200:
             raise Exception(f"Failed to fetch members from {url}")
 
         try:
-            data = response.json()
+            data = loads(response.content)
             return [member['username'] for member in data.get('members', []) if "username" in member]
         except Exception as e:
             print(f"Error processing response from {url}: {e}")
             return []
 
 
+    def _get(self, url) -> requests.Response:
+        """
+        Send a GET request through the session, going through the response cache when there is one.
+        Fresh entries are served locally, stale entries are revalidated with a conditional request
+        when the server gave us an ETag or a Last-Modified date.
+
+        :param url: The URL to fetch
+        :return: The response
+        """
+        if self.cache is None or not self.cache.ttl_for(url):
+            return self._send(url)
+
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.is_fresh(entry):
+            return entry.to_response()
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        response = self._send(url, headers)
+
+        if response.status_code == 304 and entry is not None:
+            self.cache.touch(url)
+            return entry.to_response()
+
+        if response.status_code == 200:
+            self.cache.put(url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+        return response
+
+    def _send(self, url, headers: Optional[dict] = None) -> requests.Response:
+        """
+        Send a GET request over the session, through the rate limiter when there is one.
+        If the server rejects the session and the scraper has a session manager, the session
+        is renewed and the request sent again.
+
+        :param url: The URL to fetch
+        :param headers: Extra headers for this request
+        :return: The response
+        """
+        session_id = self.huSessID
+        response = self._send_once(url, headers)
+
+        # The session expired: renew it (or pick up the one renewed by another worker) and try again
+        if response.status_code in (401, 403) and self.session_manager is not None:
+            print(f"Session rejected with {response.status_code}, refreshing it...")
+            self.session_manager.refresh(self, stale_session_id=session_id)
+            response = self._send_once(url, headers)
+
+        return response
+
+    def _send_once(self, url, headers: Optional[dict] = None) -> requests.Response:
+        if self.rate_limiter is None:
+            return self.session.get(url, headers=headers)
+        return self.rate_limiter.request(lambda: self.session.get(url, headers=headers))
+
+    def _resize_connection_pool(self, max_workers: int) -> None:
+        """
+        Make sure the session keeps enough connections open for max_workers concurrent requests,
+        otherwise urllib3 discards the extra connections and has to reconnect for every request.
+
+        :param max_workers: The number of concurrent requests
+        """
+        pool_size = max(max_workers, DEFAULT_POOLSIZE)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
     def reset(self):
         """
         Reset the scraper by clearing the stored cookies and session data.
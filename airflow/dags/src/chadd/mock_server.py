@@ -0,0 +1,205 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class MockHealthUnlockedServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 1.0, total_members: int = 120, posts_per_month: int = 5,
+                 fixtures_dir: str = FIXTURES_DIR, seed: Optional[int] = 0, port: int = 0):
+        """
+        Local stand-in for the HealthUnlocked API, replaying the fixture JSON files so that the scraper
+        can be tested and benchmarked offline. The IDs and usernames in the fixtures are rewritten so
+        that every post, profile and members page looks different.
+
+        :param latency: Seconds to wait before answering each request
+        :param error_rate: Probability of answering a GET request with a 500
+        :param throttle_rate: Probability of answering a GET request with a 429
+        :param retry_after: Value of the Retry-After header sent with the 429s
+        :param total_members: Number of members in the community listing
+        :param posts_per_month: Number of posts in each monthly listing
+        :param fixtures_dir: Directory holding latest.json, post.json, profile.json and members.json
+        :param seed: Seed of the random generator deciding which requests fail
+        :param port: Port to listen on, 0 picks a free one
+        """
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.total_members = total_members
+        self.posts_per_month = posts_per_month
+
+        self.fixtures = {}
+        for name in ('latest', 'post', 'profile', 'members'):
+            with open(os.path.join(fixtures_dir, f'{name}.json'), 'r') as f:
+                self.fixtures[name] = json.load(f)
+
+        self.sessions = set()
+        self.hits = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> 'MockHealthUnlockedServer':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def expire_sessions(self) -> None:
+        """
+        Forget every session, as if they all expired server-side.
+        """
+        with self._lock:
+            self.sessions.clear()
+
+    def new_session(self) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self.sessions.add(session_id)
+        return session_id
+
+    def pick_failure(self) -> Optional[int]:
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def latest(self, year: int, month: int) -> list:
+        # Each month gets its own range of post IDs
+        month_offset = (year - 2000) * 12 + month
+        template = self.fixtures['latest']
+        listing = []
+        for i in range(self.posts_per_month):
+            entry = dict(template[i % len(template)])
+            entry['postId'] = 150000000 + month_offset * 10000 + i
+            listing.append(entry)
+        return listing
+
+    def post(self, post_id: int) -> dict:
+        post = dict(self.fixtures['post'])
+        post['id'] = post_id
+        return post
+
+    def profile(self, username: str) -> dict:
+        profile = dict(self.fixtures['profile'])
+        profile['profileUser'] = dict(profile['profileUser'], username=username)
+        return profile
+
+    def members(self, start: int) -> dict:
+        template = self.fixtures['members']['members']
+        members = []
+        for i in range(start, min(start + len(template), self.total_members)):
+            member = dict(template[i % len(template)])
+            if i >= len(template):
+                member['username'] = f"{member['username']}{i // len(template)}"
+            members.append(member)
+        return {'members': members}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, Nagle would delay every response by the client's delayed ACK
+    disable_nagle_algorithm = True
+    server: MockHealthUnlockedServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if urlparse(self.path).path != '/session':
+            return self._send(404)
+
+        self.server.hits['session'] += 1
+        session_id = self.server.new_session()
+        self._send(200, {}, cookies={'huSessID': session_id, 'huBv': 'mock', 'huLang': 'en'})
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        query = parse_qs(url.query)
+
+        if parts[:2] == ['private', 'posts'] and len(parts) == 4 and parts[3] == 'latest':
+            route = 'latest'
+        elif parts[:2] == ['private', 'posts'] and len(parts) == 4 and parts[3].isdigit():
+            route = 'post'
+        elif parts[:3] == ['private', 'user', 'profile'] and len(parts) == 4:
+            route = 'profile'
+        elif parts[:2] == ['private', 'members'] and len(parts) == 3:
+            route = 'members'
+        else:
+            return self._send(404)
+
+        self.server.hits[route] += 1
+
+        if self._cookies().get('huSessID') not in self.server.sessions:
+            return self._send(401)
+
+        status = self.server.pick_failure()
+        if status == 429:
+            return self._send(429, headers={'Retry-After': str(self.server.retry_after)})
+        if status is not None:
+            return self._send(status)
+
+        if route == 'latest':
+            body = self.server.latest(int(query['year'][0]), int(query['month'][0]))
+        elif route == 'post':
+            body = self.server.post(int(parts[3]))
+        elif route == 'profile':
+            body = self.server.profile(parts[3])
+        else:
+            body = self.server.members(int(query.get('start', ['0'])[0]))
+
+        self._send(200, body)
+
+    def _cookies(self) -> dict:
+        cookies = {}
+        for part in (self.headers.get('Cookie') or '').split(';'):
+            name, _, value = part.strip().partition('=')
+            cookies[name] = value
+        return cookies
+
+    def _send(self, status: int, body=None, headers: Optional[dict] = None, cookies: Optional[dict] = None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        for name, value in (cookies or {}).items():
+            self.send_header('Set-Cookie', f'{name}={value}; Path=/')
+        self.end_headers()
+        self.wfile.write(payload)
@@ -2,6 +2,8 @@ from typing import List, Dict
 
 
 class Condition:
+    __slots__ = ("name", "treatments", "severity")
+
     def __init__(self,
                  name: str,
                  treatments: List[Dict],
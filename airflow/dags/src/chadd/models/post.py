@@ -1,11 +1,14 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Iterable, Optional, List
 
 from src.chadd.models.response import Response
 from src.chadd.models.user import User
+from src.utils.fast_json import parse_iso_datetime
 
 
 class Post:
+    __slots__ = ("post_id", "title", "body", "author", "date_created", "total_responses", "responses")
+
     def __init__(self,
                  post_id: int,
                  title: str,
@@ -40,20 +43,17 @@ class Post:
         responses = []
         for response_data in api_response.get("responses", []):
             response_author_data = response_data.get("author", {})
-            response_author = User(
+            # Response authors don't have detailed demographics, one shared instance per user is enough
+            response_author = User.intern(
                 user_id=response_author_data.get("id"),
                 username=response_author_data.get("username"),
-                age=None,  # Response authors might not have detailed demographics
-                gender=None,
-                country=None,
-                bio=None,
             )
             responses.append(
                 Response(
                     response_id=response_data.get("id"),
                     author=response_author,
                     body=response_data.get("body"),
-                    date_created=datetime.strptime(response_data.get("dateCreated"), "%Y-%m-%dT%H:%M:%S.%fZ"),
+                    date_created=parse_iso_datetime(response_data.get("dateCreated")),
                 )
             )
 
@@ -62,18 +62,34 @@ class Post:
             title=api_response.get("title"),
             body=api_response.get("body"),
             author=author,
-            date_created=datetime.strptime(api_response.get("dateCreated"), "%Y-%m-%dT%H:%M:%S.%fZ"),
+            date_created=parse_iso_datetime(api_response.get("dateCreated")),
             total_responses=api_response.get("totalResponses", 0),
             responses=responses,
         )
 
-    def to_dict(self) -> dict:
-        return {
+    @classmethod
+    def from_json_list(cls, api_responses: Iterable[dict]) -> List['Post']:
+        """
+        Convert a batch of decoded post payloads, e.g. a backfill read back from disk.
+        """
+        from_json = cls.from_json
+        return [from_json(api_response) for api_response in api_responses]
+
+    def to_dict(self, include_responses: bool = True) -> dict:
+        post = {
             "post_id": self.post_id,
             "title": self.title,
             "body": self.body,
             "author": self.author.to_dict(),
-            "date_created": self.date_created.isoformat(),
+            "date_created": self.date_created,
             "total_responses": self.total_responses,
-            "responses": [response.to_dict() for response in self.responses],
-        }
\ No newline at end of file
+        }
+        if include_responses:
+            post["responses"] = [response.to_dict() for response in self.responses]
+        return post
+
+    def responses_to_dicts(self) -> List[dict]:
+        """
+        The responses as standalone documents, keyed by post_id and response_id.
+        """
+        return [dict(response.to_dict(), post_id=self.post_id) for response in self.responses]
\ No newline at end of file
@@ -4,6 +4,9 @@ from src.chadd.models.user import User
 
 
 class Response:
+    # Responses are by far the most numerous objects of a backfill, __slots__ saves the per-instance __dict__
+    __slots__ = ("response_id", "author", "body", "date_created")
+
     def __init__(self,
                  response_id: int,
                  author: User,
@@ -22,5 +25,5 @@ class Response:
             "response_id": self.response_id,
             "author": self.author.username,
             "body": self.body,
-            "date_created": self.date_created.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            "date_created": self.date_created
         }
\ No newline at end of file
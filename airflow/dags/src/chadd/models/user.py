@@ -1,10 +1,16 @@
-from typing import List, Optional
+from typing import Iterable, List, Optional
 from datetime import datetime
+from weakref import WeakValueDictionary
 
 from src.chadd.models.condition import Condition
 
 
 class User:
+    __slots__ = ("user_id", "username", "age", "gender", "country", "bio", "conditions", "_read_only", "__weakref__")
+
+    # Users only known by their ID and username, shared by all the responses they wrote
+    _interned = WeakValueDictionary()
+
     def __init__(self,
                  user_id: int,
                  username: str,
@@ -21,9 +27,34 @@ class User:
         self.bio = bio
         self.conditions = conditions or []
 
+    def __setattr__(self, name, value):
+        # Interned users are shared by every response of the author, a change would show up in all of them
+        if getattr(self, "_read_only", False):
+            raise AttributeError(f"Interned user {self.username} is shared and read-only, create a new User instead")
+        object.__setattr__(self, name, value)
+
     def __repr__(self):
         return f"User(id={self.user_id}, username={self.username}, age={self.age}, gender={self.gender}, country={self.country}, bio={self.bio}, conditions={self.conditions})"
 
+    @classmethod
+    def intern(cls, user_id: int, username: str) -> 'User':
+        """
+        Get the shared instance of a user known only by their ID and username (e.g. a response author),
+        creating it on first use. The instance is shared, so it is read-only: setting an attribute raises
+        AttributeError, and its conditions are an empty tuple.
+
+        :param user_id: The ID of the user
+        :param username: The username of the user
+        """
+        key = (user_id, username)
+        user = cls._interned.get(key)
+        if user is None:
+            user = cls(user_id=user_id, username=username)
+            user.conditions = ()
+            user._read_only = True
+            user = cls._interned.setdefault(key, user)
+        return user
+
     @classmethod
     def from_json(cls, api_response: dict) -> 'User':
         basics = api_response.get("basics", {})
@@ -38,6 +69,14 @@ class User:
             conditions=[Condition.from_json(condition) for condition in conditions]
         )
 
+    @classmethod
+    def from_json_list(cls, api_responses: Iterable[dict]) -> List['User']:
+        """
+        Convert a batch of decoded profile payloads.
+        """
+        from_json = cls.from_json
+        return [from_json(api_response) for api_response in api_responses]
+
 
     def to_dict(self):
         return {
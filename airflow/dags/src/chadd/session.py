@@ -0,0 +1,113 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from src.chadd.chadd_scrap import ChaddScraper
+
+
+class SessionManager:
+    def __init__(self, cookie_file: str, email: Optional[str], password: Optional[str],
+                 base_url: str = 'https://healthunlocked.com', community: str = 'adult-adhd'):
+        """
+        Keep a single HealthUnlocked session for every task and worker. The session cookies are stored
+        in cookie_file, which should live on a volume shared by the workers, and a new login only happens
+        when the stored session is rejected by the server.
+
+        :param cookie_file: Path of the JSON file where the cookies are stored
+        :param email: The login email, used when the session has to be renewed
+        :param password: The login password, used when the session has to be renewed
+        :param base_url: The base URL of the website
+        :param community: The community used by the probe request
+        """
+        self.cookie_file = cookie_file
+        self.email = email
+        self.password = password
+        self.base_url = base_url
+        self.community = community
+        self._lock = threading.Lock()
+
+    def get_scraper(self, **kwargs) -> ChaddScraper:
+        """
+        Build a scraper from the stored cookies, logging in again only if they are missing or expired.
+        The scraper refreshes its session through this manager if it expires in the middle of a run.
+
+        :param kwargs: Extra arguments for the ChaddScraper constructor (cache, rate_limiter...)
+        :return: A logged in scraper
+        """
+        scraper = ChaddScraper(email=self.email, password=self.password, base_url=self.base_url, **kwargs)
+        scraper.session_manager = self
+
+        cookies = self.load_cookies()
+        if cookies and cookies.get('huSessID'):
+            scraper.apply_cookies(cookies)
+            if self.is_valid(scraper):
+                print("Stored session is still valid.")
+                return scraper
+            print("Stored session was rejected.")
+
+        self.refresh(scraper, stale_session_id=cookies.get('huSessID') if cookies else None)
+        return scraper
+
+    def is_valid(self, scraper: ChaddScraper) -> bool:
+        """
+        Check the scraper's session with a cheap request (the first page of the members listing).
+        """
+        url = f"{self.base_url}/private/members/{self.community}?start=0"
+        try:
+            response = scraper.session.get(url, allow_redirects=False)
+        except Exception as e:
+            print(f"Session probe failed: {e}")
+            return False
+        return response.status_code == 200
+
+    def refresh(self, scraper: ChaddScraper, stale_session_id: Optional[str] = None) -> None:
+        """
+        Give the scraper a working session. If another thread or worker already renewed the session
+        rejected for stale_session_id, its cookies are reused, otherwise we log in and store the new cookies.
+
+        :param scraper: The scraper whose session was rejected
+        :param stale_session_id: The huSessID that was rejected
+        """
+        with self._lock, open(self.cookie_file + '.lock', 'w') as lock_file:
+            # Only one worker logs in at a time, the others wait and pick up its cookies
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                cookies = self.load_cookies()
+                if cookies and cookies.get('huSessID') and cookies.get('huSessID') != stale_session_id:
+                    scraper.apply_cookies(cookies)
+                    if self.is_valid(scraper):
+                        print("Reusing the session renewed by another worker.")
+                        return
+
+                # No reset here: the other threads keep using the scraper while we log in,
+                # and the login response replaces the stale cookies
+                scraper.login()
+                self.save_cookies(scraper.get_cookies())
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load_cookies(self) -> Optional[dict]:
+        if not os.path.exists(self.cookie_file):
+            return None
+        try:
+            with open(self.cookie_file, 'r') as f:
+                return json.load(f)
+        except ValueError as e:
+            print(f"Ignoring unreadable cookie file {self.cookie_file}: {e}")
+            return None
+
+    def save_cookies(self, cookies: dict) -> None:
+        # Write to a temporary file and rename it, so that readers never see a half-written file
+        directory = os.path.dirname(os.path.abspath(self.cookie_file))
+        fd, temporary_path = tempfile.mkstemp(dir=directory, prefix='.cookies-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cookies, f)
+            os.replace(temporary_path, self.cookie_file)
+        except Exception:
+            os.remove(temporary_path)
+            raise
+        print(f"Cookies saved to {os.path.abspath(self.cookie_file)}")
@@ -1,9 +1,14 @@
-from pymongo import MongoClient
+import datetime
+
+from pymongo.errors import OperationFailure
+
+from src.utils.mongo import BulkUpsertWriter
+from src.utils.mongo_client import get_client
 
 
 def check_staging_db():
     try:
-        client = MongoClient('mongo', 27017)
+        client = get_client()
         db = client['chadd_staging_db']
         post_collection = db['posts']
         members_collection = db['members']
@@ -18,9 +23,13 @@ def check_staging_db():
     else:
         return False
 
-def load_posts_to_prod_db():
+def load_posts_to_prod_db(**context):
+    # The whole migration runs inside MongoDB, the per-post Python loop is kept as a fallback
+    if context.get('server_side', True):
+        return merge_posts_to_prod_db()
+
     try:
-        client = MongoClient('mongo', 27017)
+        client = get_client()
         db = client['chadd_staging_db']
         post_collection = db['posts']
         members_collection = db['members']
@@ -66,9 +75,60 @@ def load_posts_to_prod_db():
         print(f"Error during migration: {e}")
 
 
-def load_members_to_prod_db():
+def merge_posts_to_prod_db():
+    """
+    Copy the staging posts to Production_db.posts with a single aggregation: the authors are joined with
+    $lookup (on the author_id index of the members), the documents are reshaped to the production schema
+    and written with $merge on (id, Source), so that posts already loaded are updated instead of duplicated.
+    """
+    client = get_client()
+    db = client['chadd_staging_db']
+    post_collection = db['posts']
+
+    pipeline = [
+        # A null or missing author_id would be joined with every member without one
+        {'$match': {'author.author_id': {'$ne': None}}},
+        {'$lookup': {
+            'from': 'members',
+            'localField': 'author.author_id',
+            'foreignField': 'author_id',
+            'as': 'member',
+        }},
+        # Posts whose author is not staged are skipped, like a failed find_one
+        {'$unwind': '$member'},
+        {'$project': {
+            '_id': 0,
+            'id': '$post_id',
+            'created_at': '$date_created',
+            'Author': {'$concat': ['ch/', '$member.username']},
+            'Gender': '$member.gender',
+            'Self-Diagnosis': {'$cond': [{'$eq': ['$self-diagnosed', 'Yes']}, 1, 0]},
+            'Self-Medication': {'$cond': [{'$eq': ['$self-medicated', 'Yes']}, 1, 0]},
+            'Sentiment': '$sentiment',
+            'Text': '$body',
+            'Source': {'$literal': 'HealthUnlocked'},
+        }},
+        # Needs the unique (id, Source) index declared in src/utils/indexes.py
+        {'$merge': {
+            'into': {'db': 'Production_db', 'coll': 'posts'},
+            'on': ['id', 'Source'],
+            'whenMatched': 'merge',
+            'whenNotMatched': 'insert',
+        }},
+    ]
+
+    try:
+        post_collection.aggregate(pipeline, allowDiskUse=True)
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        raise
+
+    loaded = client['Production_db']['posts'].count_documents({'Source': 'HealthUnlocked'})
+    print(f"Posts merged successfully, {loaded} HealthUnlocked posts in production.")
+
+def load_members_to_prod_db(**context):
     try:
-        client = MongoClient('mongo', 27017)
+        client = get_client()
         db = client['chadd_staging_db']
         members_collection = db['members']
         print("Connected to MongoDB successfully.")
@@ -76,28 +136,92 @@ def load_members_to_prod_db():
         print(f"Error connecting to MongoDB: {e}")
         return "Failed to connect to MongoDB."
 
-    try:
-        # Connect to the production database
-        prod_db = client['Production_db']
-        prod_members_collection = prod_db['members']
-
-        members_count = members_collection.count_documents({})
-        print(f"Found {members_count} members in the staging database.")
-
-        if members_count > 0:
-            members = members_collection.find({})
-            prod_members_collection.insert_many(members, ordered=False)
-            print(f"{members_count} members migrated successfully.")
-        else:
-            print("No members found in the staging database.")
-
-    except Exception as e:
-        print(f"Error during migration: {e}")
+    members_count = members_collection.count_documents({})
+    print(f"Found {members_count} members in the staging database.")
+    if members_count == 0:
+        print("No members found in the staging database.")
+        return
+
+    if context.get('server_side', True):
+        try:
+            merge_members_to_prod_db()
+            return
+        except OperationFailure as e:
+            # e.g. no unique author_id index yet because older runs left duplicates in production
+            print(f"Server-side merge failed, copying the members in chunks instead: {e}")
+
+    copy_members_in_chunks(chunk_size=context.get('chunk_size', 1000))
+
+def merge_members_to_prod_db():
+    """
+    Copy the staging members to Production_db.members with a single $merge on author_id,
+    so that members already loaded are updated instead of duplicated.
+    """
+    client = get_client()
+    db = client['chadd_staging_db']
+    members_collection = db['members']
+
+    pipeline = [
+        {'$match': {'author_id': {'$ne': None}}},
+        # Production documents keep their own _id
+        {'$project': {'_id': 0}},
+        # Needs the unique author_id index declared in src/utils/indexes.py
+        {'$merge': {
+            'into': {'db': 'Production_db', 'coll': 'members'},
+            'on': 'author_id',
+            'whenMatched': 'merge',
+            'whenNotMatched': 'insert',
+        }},
+    ]
+    members_collection.aggregate(pipeline, allowDiskUse=True)
+
+    loaded = client['Production_db']['members'].count_documents({})
+    print(f"Members merged successfully, {loaded} members in production.")
+
+def copy_members_in_chunks(chunk_size=1000):
+    """
+    Copy the staging members to Production_db.members in _id order, chunk_size members at a time,
+    with upserts on author_id. The last copied _id is stored in Production_db.load_checkpoints after
+    every chunk, so that a failed copy resumes where it stopped instead of starting over.
+    """
+    client = get_client()
+    members_collection = client['chadd_staging_db']['members']
+    prod_members_collection = client['Production_db']['members']
+    checkpoints = client['Production_db']['load_checkpoints']
+
+    checkpoint = checkpoints.find_one({'_id': 'members'})
+    query = {'author_id': {'$ne': None}}
+    if checkpoint:
+        print(f"Resuming the copy after _id {checkpoint['last_id']}.")
+        query['_id'] = {'$gt': checkpoint['last_id']}
+
+    writer = BulkUpsertWriter(prod_members_collection, keys=['author_id'], batch_size=chunk_size)
+
+    def write(chunk):
+        writer.write({key: value for key, value in member.items() if key != '_id'} for member in chunk)
+        checkpoints.update_one(
+            {'_id': 'members'},
+            {'$set': {'last_id': chunk[-1]['_id'], 'updated_at': datetime.datetime.utcnow()}},
+            upsert=True,
+        )
+
+    chunk = []
+    for member in members_collection.find(query).sort('_id', 1).batch_size(chunk_size):
+        chunk.append(member)
+        if len(chunk) >= chunk_size:
+            write(chunk)
+            chunk = []
+    if chunk:
+        write(chunk)
+
+    # The copy is complete, the next run starts from the beginning again
+    checkpoints.delete_one({'_id': 'members'})
+    print(f"Members copied: {writer.totals}")
 
 
 def clean_prod_db():
     try:
-        client = MongoClient('mongo', 27017)
+        client = get_client()
         db = client['chadd_production_db']
         db.drop_collection('posts')
         db.drop_collection('members')
@@ -1,19 +1,34 @@
 import json
 import os
+from contextlib import nullcontext
+from datetime import datetime
 from typing import List
 
 import requests
 from dotenv import load_dotenv
 from ollama import chat, ChatResponse, Client
 
-from pymongo import MongoClient, UpdateOne
+from pymongo import UpdateOne
 
 from src.chadd.chadd_scrap import ChaddScraper
+from src.chadd.session import SessionManager
+from src.utils.enrichment import (DEFAULT_MAX_ATTEMPTS, DEFAULT_MAX_IN_FLIGHT, enrich_concurrently,
+                                  enrichment_update, pending_query)
+from src.utils.http_cache import ResponseCache
+from src.utils.llm_cache import LLMCache
+from src.utils.mongo_client import get_client, print_pool_stats
+from src.utils.rate_limiter import RateLimiter
 
 from src.utils.mongo import *
 
 BASE_URL = 'https://healthunlocked.com'
-CONFIG_FILE = 'cookies.json'
+# Shared by every task and worker, so it should live on a volume mounted on all of them
+CONFIG_FILE = os.getenv('CHADD_COOKIE_FILE', 'cookies.json')
+HTTP_CACHE_FILE = 'http_cache.sqlite'
+# Number of HealthUnlocked requests allowed in flight at the same time
+DEFAULT_MAX_WORKERS = 8
+# Average number of HealthUnlocked requests allowed per second
+DEFAULT_REQUESTS_PER_SECOND = 5
 
 def check_cookie_file():
     # Check if the cookie file exists, and if has the required keys
@@ -24,14 +39,19 @@ def check_cookie_file():
                 return True
     return False
 
-def init_chadd_scraper(**context):
+def get_session_manager():
     load_dotenv()
     email = os.getenv('CHADD_USERNAME')
     password = os.getenv('CHADD_PASSWORD')
 
-    scraper = ChaddScraper(email= email, password= password, base_url=BASE_URL)
+    return SessionManager(CONFIG_FILE, email=email, password=password, base_url=BASE_URL)
+
+def init_chadd_scraper(**context):
+    session_manager = get_session_manager()
+
+    scraper = ChaddScraper(email=session_manager.email, password=session_manager.password, base_url=BASE_URL)
     scraper.login()
-    scraper.save_cookies_to_file(filename=CONFIG_FILE)
+    session_manager.save_cookies(scraper.get_cookies())
 
     print("Cookies saved!")
 
@@ -44,82 +64,188 @@ def clean_staging_db_func(**context):
     # Clean the staging database
     clean_staging_db()
 
+def open_response_cache(**context):
+    # The detail endpoints are cached on disk unless the task is run with use_cache=False.
+    # Use it in a with block so that the SQLite file is closed at the end of the task.
+    if not context.get('use_cache', True):
+        return nullcontext()
+    return ResponseCache(HTTP_CACHE_FILE)
+
+def build_rate_limiter(**context):
+    # One limiter per task, shared by all the worker threads of the task
+    max_workers = context.get('max_workers', DEFAULT_MAX_WORKERS)
+    return RateLimiter(
+        rate=context.get('requests_per_second', DEFAULT_REQUESTS_PER_SECOND),
+        burst=max_workers,
+        max_concurrency=max_workers,
+    )
+
 def load_scraper_from_cookies(**context):
-    # load the cookies from the file
-    scraper = ChaddScraper.from_config(CONFIG_FILE)
+    # load the cookies from the file, logging in again only if the stored session expired
+    get_session_manager().get_scraper()
     print("Scraper loaded from cookies!")
 
 
 def fetch_posts_task(**context):
-    # Get the cookies from XCom
-    scraper = ChaddScraper.from_config(CONFIG_FILE)
+    # Reuse the stored session, logging in again only if it expired
+    scraper = get_session_manager().get_scraper(rate_limiter=build_rate_limiter(**context))
     # Fetch posts
-    post_ids = scraper.get_posts_ids(start_date=context['start_date'], end_date=context['end_date'], community='adult-adhd')
+    post_ids = scraper.get_posts_ids(start_date=context['start_date'], end_date=context['end_date'], community='adult-adhd',
+                                     max_workers=context.get('max_workers', DEFAULT_MAX_WORKERS))
     insert_post_ids(post_ids)
 
+def fetch_new_posts_task(**context):
+    """
+    Incremental version of fetch_posts_task. Only the months after the community's watermark
+    are listed, plus lookback_months already scraped months to catch late posts and edits.
+    The new watermark, the last month of the run that was listed without gaps, is pushed to XCom
+    and only stored by commit_watermark once the post details are staged.
+
+    Returns the first month fetched.
+    """
+    community = context.get('community', 'adult-adhd')
+    lookback_months = context.get('lookback_months', 1)
+    end_date = context.get('end_date') or datetime.utcnow().strftime('%Y-%m')
+
+    watermark = get_watermark(community)
+    if watermark is None:
+        start_date = context['start_date']
+        print(f"No watermark found for {community}, starting from {start_date}.")
+    else:
+        start_date = max(shift_month(watermark['last_month'], 1 - lookback_months), context['start_date'])
+        print(f"Watermark for {community} is {watermark['last_month']}, starting from {start_date}.")
+
+    if start_date > end_date:
+        print("Nothing new to fetch.")
+        return end_date
+
+    scraper = get_session_manager().get_scraper(rate_limiter=build_rate_limiter(**context))
+    posts_by_month = scraper.get_posts_ids_by_month(start_date=start_date, end_date=end_date, community=community,
+                                                    max_workers=context.get('max_workers', DEFAULT_MAX_WORKERS))
+    insert_post_ids_by_month(posts_by_month)
+
+    # Advance the watermark up to the first month that failed, so it is fetched again next run
+    last_month, last_post_id = None, None
+    for month, month_ids in posts_by_month.items():
+        if month_ids is None:
+            break
+        last_month = month
+        last_post_id = max(month_ids, default=last_post_id)
+
+    if last_month is not None:
+        context['ti'].xcom_push(key='watermark', value={
+            'community': community,
+            'last_month': last_month,
+            'last_post_id': last_post_id,
+        })
+
+    return start_date
+
+def commit_watermark(**context):
+    # Runs after fill_posts_collection_task: a failed detail run leaves the watermark where it was,
+    # so that the next run lists the same months again
+    watermark = context['ti'].xcom_pull(task_ids='fetch_posts_task', key='watermark')
+    if watermark is None:
+        print("No new watermark to store.")
+        return
+    set_watermark(watermark['community'], watermark['last_month'], watermark['last_post_id'])
+    print(f"Watermark for {watermark['community']} moved to {watermark['last_month']}.")
+
+def shift_month(month, offset):
+    # Shift a 'YYYY-MM' string by offset months
+    year, month = map(int, month.split('-'))
+    index = year * 12 + (month - 1) + offset
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
 def fetch_members_for_posts(**context):
-    try:
-        client = MongoClient('mongo', 27017)
-        db = client['chadd_staging_db']
-        post_collection = db['posts']
-        print("Connected to MongoDB successfully.")
-    except Exception as e:
-        raise ValueError(f"Error connecting to MongoDB: {e}")
+    # Unique post and response authors, read with an aggregation instead of loading every post
+    authors = get_post_authors()
+    print(f"Found {len(authors)} distinct authors in the staged posts.")
+    insert_members([author['_id'] for author in authors])
 
-    # for each post, fetch the member information, and insert it in the staging collection
-    posts = list(post_collection.find())
-    members = []
-    for post in posts:
-        members.append(post['author']['username'])
-    insert_members(members)
+    # Post authors already come with some profile fields: store them so that the later tasks can use them
+    # right away. They have no conditions, so their profile is still fetched by fetch_members_details.
+    if context.get('reuse_embedded_authors', True):
+        seed_members_from_posts([author['profile'] for author in authors
+                                 if author['profile'] and author['profile'].get('author_id') is not None])
+
+    # Members seeded from posts are fetched in every mode. Staging members are upserted in incremental
+    # mode, so stale profiles can be fetched again too.
+    mark_stale_profiles(context.get('profile_max_age_days', 30) if context.get('incremental') else None)
 
 
 def fetch_members_for_all_posts(**context):
-    # Get the cookies from XCom
-    scraper = ChaddScraper.from_config(CONFIG_FILE)
+    # Reuse the stored session, logging in again only if it expired
+    scraper = get_session_manager().get_scraper(rate_limiter=build_rate_limiter(**context))
 
     # Fetch members
-    members = scraper.get_all_members(community='adult-adhd')
+    members = scraper.get_all_members(community='adult-adhd', max_workers=context.get('max_workers', DEFAULT_MAX_WORKERS))
     insert_members(members)
     print(members)
 
 
 def fetch_post_details(**context):
-    # delete the cookie file
-    os.remove(CONFIG_FILE)
-
-    init_chadd_scraper()
-    scraper = ChaddScraper.from_config(CONFIG_FILE)
-
-    # Fetch post details
-    post_ids = get_post_ids()
-    posts = []
-    for post_id in post_ids:
-        print('Fetching details for:', post_id)
-        post = scraper.get_post_details(post_id)
-        posts.append(post)
+    # The cache is closed at the end of the task, it is opened again by the next one
+    with open_response_cache(**context) as cache:
+        scraper = get_session_manager().get_scraper(cache=cache, rate_limiter=build_rate_limiter(**context))
+
+        # Only the posts that are not staged yet or that failed less than max_attempts times,
+        # streamed from the ingestion database instead of loaded as one list
+        post_ids = iter_pending_post_ids(max_attempts=context.get('max_attempts', 3))
+        max_workers = context.get('max_workers', DEFAULT_MAX_WORKERS)
+        print(f'Fetching post details with {max_workers} workers...')
+
+        write_details = upsert_post_details if context.get('incremental') else insert_post_details
+
+        def write(fetched):
+            # Posts the database rejected (e.g. too large) are retried like the ones that failed to download
+            not_written = write_details([post for _, post in fetched], separate_responses=context.get('separate_responses', False))
+            mark_post_ids_status(done=[post_id for post_id, _ in fetched if post_id not in not_written],
+                                 failed=not_written)
+
+        # Posts are written every batch_size posts so that memory stays flat and a crash keeps what was fetched
+        failed = {}
+        with BatchSink(write, batch_size=context.get('batch_size', 500)) as sink:
+            for post_id, post, error in scraper.iter_post_details(post_ids, max_workers=max_workers):
+                if error is not None:
+                    print(f"Error fetching details for {post_id}: {error}")
+                    failed[post_id] = error
+                else:
+                    sink.add((post_id, post))
 
-    insert_post_details(posts)
+        mark_post_ids_status(failed=failed)
+        print(f'Fetched {sink.flushed} posts, {len(failed)} failed.')
+        print_pool_stats()
 
 def fetch_members_details(**context):
-    # delete the cookie file
-    os.remove(CONFIG_FILE)
-
-    init_chadd_scraper()
-    scraper = ChaddScraper.from_config(CONFIG_FILE)
-
-    # Fetch post details
-    usernames = get_members_usernames()
-    members = []
-    for username in usernames:
-        try:
-            print('Fetching details for:', username)
-            member = scraper.get_user_details(username)
-            members.append(member)
-        except Exception as e:
-            print(f"Error fetching details for {username}: {e}")
+    # The cache is closed at the end of the task, it is opened again by the next one
+    with open_response_cache(**context) as cache:
+        scraper = get_session_manager().get_scraper(cache=cache, rate_limiter=build_rate_limiter(**context))
+
+        # Fetch member details
+        usernames = iter_pending_usernames(max_attempts=context.get('max_attempts', 3))
+        max_workers = context.get('max_workers', DEFAULT_MAX_WORKERS)
+        print(f'Fetching member details with {max_workers} workers...')
+
+        write_details = upsert_members_details if context.get('incremental') else insert_members_details
+
+        def write(fetched):
+            not_written = write_details([member for _, member in fetched])
+            mark_usernames_status(done=[username for username, _ in fetched if username not in not_written],
+                                  failed=not_written)
+
+        failed = {}
+        with BatchSink(write, batch_size=context.get('batch_size', 500)) as sink:
+            for username, member, error in scraper.iter_user_details(usernames, max_workers=max_workers):
+                if error is not None:
+                    print(f"Error fetching details for {username}: {error}")
+                    failed[username] = error
+                else:
+                    sink.add((username, member))
 
-    insert_members_details(members)
+        mark_usernames_status(failed=failed)
+        print(f'Fetched {sink.flushed} members, {len(failed)} failed.')
+        print_pool_stats()
 
 def infer_gender_from_bio(**context) -> str:
     """
@@ -131,7 +257,7 @@ def infer_gender_from_bio(**context) -> str:
     """
     # Initialize MongoDB client
     try:
-        client = MongoClient('mongo', 27017)
+        client = get_client()
         db = client['chadd_staging_db']
         members_collection = db['members']
         print("Connected to MongoDB successfully.")
@@ -167,48 +293,72 @@ def infer_gender_from_bio(**context) -> str:
     if not documents:
         return "No documents to update."
 
-    # Prepare bulk operations
-    bulk_operations: List[UpdateOne] = []
+    # Answers already computed for the same text by the same model and modelfile are reused,
+    # unless the task runs with use_llm_cache=False
+    cache = LLMCache() if context.get('use_llm_cache', True) else None
+    fingerprint = cache.ollama_fingerprint(client, 'genderizer') if cache is not None else None
 
-    for doc in documents:
+    def classify(doc):
         bio = doc.get("bio")
         bio = bio.strip() if bio else ""
         member_id = doc.get("_id")
 
         if not bio:
-            inferred_gender = "unknown"
             print(f"Document ID {member_id} has empty bio. Setting gender to 'unknown'.")
-        else:
-            try:
-                response: ChatResponse = client.chat(
-                    model='genderizer',
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": bio
-                        }
-                    ]
-                )
-
-                inferred_gender = response.message.content
-
-                if inferred_gender not in ["male", "female", "unknown"]:
-                    print(f"Unexpected response for Document ID {member_id}: '{inferred_gender}'. Setting to 'unknown'.")
-                    inferred_gender = "unknown"
-                else:
-                    print(f"Inferred gender for Document ID {member_id}: {inferred_gender}.")
-            except Exception as e:
-                print(f"Error calling Ollama for Document ID {member_id}: {e}. Setting gender to 'unknown'.")
+            return "unknown"
+
+        cached = cache.get(fingerprint, bio) if cache is not None else None
+        if cached is not None:
+            return cached
+
+        try:
+            response: ChatResponse = client.chat(
+                model='genderizer',
+                messages=[
+                    {
+                        "role": "user",
+                        "content": bio
+                    }
+                ]
+            )
+
+            inferred_gender = response.message.content
+
+            if inferred_gender not in ["male", "female", "unknown"]:
+                print(f"Unexpected response for Document ID {member_id}: '{inferred_gender}'. Setting to 'unknown'.")
                 inferred_gender = "unknown"
+            else:
+                print(f"Inferred gender for Document ID {member_id}: {inferred_gender}.")
+                # Only valid answers are cached, 'unknown' members are selected again to be retried
+                if cache is not None:
+                    cache.put(fingerprint, bio, 'genderizer', inferred_gender)
+        except Exception as e:
+            print(f"Error calling Ollama for Document ID {member_id}: {e}. Setting gender to 'unknown'.")
+            inferred_gender = "unknown"
+
+        return inferred_gender
+
+    # Prepare bulk operations
+    bulk_operations: List[UpdateOne] = []
+
+    # Several bios are classified at the same time, so that Ollama is never idle between requests
+    for doc, inferred_gender, error in enrich_concurrently('infer_gender_from_bio', classify, documents,
+                                                           context.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT)):
+        if error is not None:
+            print(f"Error classifying Document ID {doc.get('_id')}: {error}. Setting gender to 'unknown'.")
+            inferred_gender = "unknown"
 
         # Prepare the update operation
         bulk_operations.append(
             UpdateOne(
-                {"_id": member_id},
+                {"_id": doc.get("_id")},
                 {"$set": {"gender": inferred_gender}}
             )
         )
 
+    if cache is not None:
+        cache.report('infer_gender_from_bio')
+
     # Execute bulk updates
     try:
         if bulk_operations:
@@ -224,7 +374,7 @@ def infer_gender_from_bio(**context) -> str:
 
 def homogenize_gender(**context) -> None:
     try:
-        client = MongoClient('mongo', 27017)
+        client = get_client()
         db = client['chadd_staging_db']
         members_collection = db['members']
         print("Connected to MongoDB successfully.")
@@ -257,7 +407,7 @@ def homogenize_gender(**context) -> None:
 
 def analyze_sentiment(**context):
     try:
-        client = MongoClient('mongo', 27017)
+        client = get_client()
         db = client['chadd_staging_db']
         post_collection = db['posts']
         print("Connected to MongoDB successfully.")
@@ -280,46 +430,77 @@ def analyze_sentiment(**context):
 
         # Prepare bulk operations
     bulk_operations: List[UpdateOne] = []
-    documents = list(post_collection.find())
-    for doc in documents:
+    # Only the posts without sentiment or labelled by an older version of the stage,
+    # and not given up on after max_attempts fallbacks, unless full_refresh
+    max_attempts = context.get('max_attempts', DEFAULT_MAX_ATTEMPTS)
+    query = {} if context.get('full_refresh', False) else pending_query('sentiment', ['sentiment'], max_attempts=max_attempts)
+    # Only the body is classified, the embedded responses are not read
+    documents = list(post_collection.find(query, {'body': 1}))
+    print(f"Found {len(documents)} posts to label.")
+    if not documents:
+        return "No documents to update."
+
+    # Answers already computed for the same text by the same model and modelfile are reused,
+    # unless the task runs with use_llm_cache=False
+    cache = LLMCache() if context.get('use_llm_cache', True) else None
+    fingerprint = cache.ollama_fingerprint(client, 'sentimentizer') if cache is not None else None
+
+    def classify(doc):
+        # Returns (sentiment, answered), answered is False when the sentiment is a fallback after an error or invalid answer
         body = doc.get("body")
         body = body.strip() if body else ""
         post_id = doc.get("_id")
 
         if not body:
-            inferred_sentiment = "neutral"
             print(f"Document ID {post_id} has empty content. Setting sentiment to 'neutral'.")
-        else:
-            try:
-                response = client.chat(
-                    model='sentimentizer',  # Replace with your actual sentiment model name
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": body
-                        }
-                    ]
-                )
-
-                inferred_sentiment = response.message.content.strip().lower()
-
-                if inferred_sentiment not in ["positive", "negative", "neutral"]:
-                    print(f"Unexpected response for Document ID {post_id}: '{inferred_sentiment}'. Setting to 'neutral'.")
-                    inferred_sentiment = "neutral"
-                else:
-                    print(f"Inferred sentiment for Document ID {post_id}: {inferred_sentiment}.")
-            except Exception as e:
-                print(f"Error calling Ollama for Document ID {post_id}: {e}. Setting sentiment to 'neutral'.")
-                inferred_sentiment = "neutral"
+            return "neutral", True
 
-        # Prepare the update operation
+        cached = cache.get(fingerprint, body) if cache is not None else None
+        if cached is not None:
+            return cached, True
+
+        try:
+            response = client.chat(
+                model='sentimentizer',  # Replace with your actual sentiment model name
+                messages=[
+                    {
+                        "role": "user",
+                        "content": body
+                    }
+                ]
+            )
+
+            inferred_sentiment = response.message.content.strip().lower()
+
+            if inferred_sentiment not in ["positive", "negative", "neutral"]:
+                print(f"Unexpected response for Document ID {post_id}: '{inferred_sentiment}'. Setting to 'neutral'.")
+                return "neutral", False
+            print(f"Inferred sentiment for Document ID {post_id}: {inferred_sentiment}.")
+            if cache is not None:
+                cache.put(fingerprint, body, 'sentimentizer', inferred_sentiment)
+        except Exception as e:
+            print(f"Error calling Ollama for Document ID {post_id}: {e}. Setting sentiment to 'neutral'.")
+            return "neutral", False
+
+        return inferred_sentiment, True
+
+    for doc, result, error in enrich_concurrently('analyze_sentiment', classify, documents,
+                                                  context.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT)):
+        if error is not None:
+            print(f"Error classifying Document ID {doc.get('_id')}: {error}. Setting sentiment to 'neutral'.")
+            result = "neutral", False
+        inferred_sentiment, answered = result
+        # Fallbacks keep their old version and count a failed attempt, the next runs label them again up to max_attempts
         bulk_operations.append(
             UpdateOne(
-                {"_id": post_id},
-                {"$set": {"sentiment": inferred_sentiment}}
+                {"_id": doc.get("_id")},
+                enrichment_update('sentiment', {"sentiment": inferred_sentiment}, answered)
             )
         )
 
+    if cache is not None:
+        cache.report('analyze_sentiment')
+
     # Execute bulk updates
     try:
         if bulk_operations:
@@ -337,7 +518,7 @@ def analyze_sentiment(**context):
 def classify_self_diagnosis_and_medication(**context):
     try:
         # Connect to MongoDB
-        client = MongoClient('mongo', 27017)
+        client = get_client()
         db = client['chadd_staging_db']
         post_collection = db['posts']
         print("Connected to MongoDB successfully.")
@@ -358,16 +539,34 @@ def classify_self_diagnosis_and_medication(**context):
 
     # Prepare bulk operations
     bulk_operations: List[UpdateOne] = []
-    documents = list(post_collection.find())
+    # Only the posts without these labels or labelled by an older version of the stage,
+    # and not given up on after max_attempts fallbacks, unless full_refresh
+    max_attempts = context.get('max_attempts', DEFAULT_MAX_ATTEMPTS)
+    query = {} if context.get('full_refresh', False) else pending_query('self_diagnosis', ['self-diagnosed', 'self-medicated'], max_attempts=max_attempts)
+    # Only the body is classified, the embedded responses are not read
+    documents = list(post_collection.find(query, {'body': 1}))
+    print(f"Found {len(documents)} posts to label.")
+    if not documents:
+        return "No documents to update."
+
+    # Answers already computed for the same text by the same model and modelfile are reused,
+    # unless the task runs with use_llm_cache=False
+    cache = LLMCache() if context.get('use_llm_cache', True) else None
+    fingerprint = cache.ollama_fingerprint(llama_client, 'selfdiagnosis-detectionizer') if cache is not None else None
 
-    for doc in documents:
+    def classify(doc):
+        # Returns ((self_diagnosed, self_medicated), answered), answered is False for the fallbacks after an error or invalid answer
         body = doc.get("body")
         body = body.strip() if body else ""
         post_id = doc.get("_id")
 
         if not body:
-            print(f"Document ID {post_id} has empty content. Skipping classification.")
-            continue
+            print(f"Document ID {post_id} has empty content. Setting defaults.")
+            return ("No", "No"), True
+
+        cached = cache.get(fingerprint, body) if cache is not None else None
+        if cached is not None:
+            return tuple(cached), True
 
         try:
             # Send the post text to the model
@@ -388,24 +587,42 @@ def classify_self_diagnosis_and_medication(**context):
             # Parse JSON response
             try:
                 classification_data = json.loads(classification)
-                self_diagnosed = classification_data.get("self-diagnosed", "No")
-                self_medicated = classification_data.get("self-medicated", "No")
+                self_diagnosed = str(classification_data.get("self-diagnosed", "No")).strip().capitalize()
+                self_medicated = str(classification_data.get("self-medicated", "No")).strip().capitalize()
+                if self_diagnosed not in ["Yes", "No"] or self_medicated not in ["Yes", "No"]:
+                    print(f"Unexpected response for Document ID {post_id}: '{classification}'. Setting invalid labels to 'No'.")
+                    self_diagnosed = self_diagnosed if self_diagnosed in ["Yes", "No"] else "No"
+                    self_medicated = self_medicated if self_medicated in ["Yes", "No"] else "No"
+                    return (self_diagnosed, self_medicated), False
+                if cache is not None:
+                    cache.put(fingerprint, body, 'selfdiagnosis-detectionizer', [self_diagnosed, self_medicated])
             except Exception as e:
                 print(f"Error parsing classification response for Document ID {post_id}: {e}")
-                self_diagnosed, self_medicated = "No", "No"
+                return ("No", "No"), False
 
         except Exception as e:
             print(f"Error calling Ollama for Document ID {post_id}: {e}. Setting defaults.")
-            self_diagnosed, self_medicated = "No", "No"
+            return ("No", "No"), False
 
-        # Prepare the update operation
+        return (self_diagnosed, self_medicated), True
+
+    for doc, result, error in enrich_concurrently('classify_self_diagnosis_and_medication', classify, documents,
+                                                  context.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT)):
+        if error is not None:
+            print(f"Error classifying Document ID {doc.get('_id')}: {error}. Setting defaults.")
+            result = ("No", "No"), False
+        (self_diagnosed, self_medicated), answered = result
+        # Fallbacks keep their old version and count a failed attempt, the next runs label them again up to max_attempts
         bulk_operations.append(
             UpdateOne(
-                {"_id": post_id},
-                {"$set": {"self-diagnosed": self_diagnosed, "self-medicated": self_medicated}}
+                {"_id": doc.get("_id")},
+                enrichment_update('self_diagnosis', {"self-diagnosed": self_diagnosed, "self-medicated": self_medicated}, answered)
             )
         )
 
+    if cache is not None:
+        cache.report('classify_self_diagnosis_and_medication')
+
     # Execute bulk updates
     try:
         if bulk_operations:
@@ -419,9 +636,134 @@ def classify_self_diagnosis_and_medication(**context):
         print(f"Error performing bulk update: {e}")
         return "Bulk update failed."
 
+POST_LABELS = {
+    'sentiment': (["positive", "negative", "neutral"], "neutral"),
+    'self-diagnosed': (["Yes", "No"], "No"),
+    'self-medicated': (["Yes", "No"], "No"),
+}
+
+def classify_posts(**context):
+    """
+    Label the sentiment, self-diagnosis and self-medication of every post in a single pass, with one
+    request to the post-classifier model per post instead of one per label, and one bulk update.
+    Labels missing from the answer fall back to the same defaults as the separate tasks.
+    """
+    try:
+        client = get_client()
+        db = client['chadd_staging_db']
+        post_collection = db['posts']
+        print("Connected to MongoDB successfully.")
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {e}")
+        return "Failed to connect to MongoDB."
+
+    # Initialize Ollama client
+    try:
+        requests.get('http://ollama:11434')  # Check Ollama server
+        llama_client = Client(
+            host='http://ollama:11434',
+        )
+        print("Initialized Llama client successfully.")
+    except Exception as e:
+        raise ValueError(f"Error initializing Llama client: {e}")
+
+    defaults = {label: default for label, (_, default) in POST_LABELS.items()}
+
+    # Answers already computed for the same text by the same model and modelfile are reused,
+    # unless the task runs with use_llm_cache=False
+    cache = LLMCache() if context.get('use_llm_cache', True) else None
+    fingerprint = cache.ollama_fingerprint(llama_client, 'post-classifier') if cache is not None else None
+
+    def classify(doc):
+        # Returns (labels, answered), answered is False when a label is a fallback after an error or invalid answer
+        body = doc.get("body")
+        body = body.strip() if body else ""
+        post_id = doc.get("_id")
+
+        if not body:
+            print(f"Document ID {post_id} has empty content. Setting defaults.")
+            return dict(defaults), True
+
+        cached = cache.get(fingerprint, body) if cache is not None else None
+        if cached is not None:
+            return cached, True
+
+        try:
+            response = llama_client.chat(
+                model='post-classifier',
+                messages=[
+                    {
+                        "role": "user",
+                        "content": body
+                    }
+                ],
+                format='json',
+            )
+            classification_data = json.loads(response.message.content.strip())
+        except Exception as e:
+            print(f"Error classifying Document ID {post_id}: {e}. Setting defaults.")
+            return dict(defaults), False
+
+        labels = {}
+        # Only cached and stamped when the model answered every label with an allowed value
+        complete = True
+        for label, (allowed, default) in POST_LABELS.items():
+            value = str(classification_data.get(label, default)).strip()
+            # The sentiment is lower case, Yes/No are capitalized
+            value = value.lower() if label == 'sentiment' else value.capitalize()
+            if label not in classification_data:
+                complete = False
+            if value not in allowed:
+                print(f"Unexpected {label} for Document ID {post_id}: '{value}'. Setting to '{default}'.")
+                value = default
+                complete = False
+            labels[label] = value
+        print(f"Labels for Document ID {post_id}: {labels}.")
+        if complete and cache is not None:
+            cache.put(fingerprint, body, 'post-classifier', labels)
+        return labels, complete
+
+    # Prepare bulk operations
+    bulk_operations: List[UpdateOne] = []
+    # Only the posts without these labels or labelled by an older version of the stage,
+    # and not given up on after max_attempts fallbacks, unless full_refresh
+    max_attempts = context.get('max_attempts', DEFAULT_MAX_ATTEMPTS)
+    query = {} if context.get('full_refresh', False) else pending_query('post_classifier', ['sentiment', 'self-diagnosed', 'self-medicated'], max_attempts=max_attempts)
+    # Only the body is classified, the embedded responses are not read
+    documents = list(post_collection.find(query, {'body': 1}))
+    print(f"Found {len(documents)} posts to label.")
+    if not documents:
+        return "No documents to update."
+
+    for doc, result, error in enrich_concurrently('classify_posts', classify, documents,
+                                                  context.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT)):
+        if error is not None:
+            print(f"Error classifying Document ID {doc.get('_id')}: {error}. Setting defaults.")
+            result = dict(defaults), False
+        labels, answered = result
+        # All the labels of the post are written by the same update. Fallbacks keep their old version and
+        # count a failed attempt, the next runs label them again up to max_attempts
+        bulk_operations.append(UpdateOne({"_id": doc.get("_id")}, enrichment_update('post_classifier', labels, answered)))
+
+    if cache is not None:
+        cache.report('classify_posts')
+
+    # Execute bulk updates
+    try:
+        if bulk_operations:
+            result = post_collection.bulk_write(bulk_operations, ordered=False)
+            print(f"Bulk update completed. Matched: {result.matched_count}, Modified: {result.modified_count}.")
+            return f"Bulk update completed. Matched: {result.matched_count}, Modified: {result.modified_count}."
+        else:
+            print("No update operations to perform.")
+            return "No updates performed."
+    except Exception as e:
+        print(f"Error performing bulk update: {e}")
+        return "Bulk update failed."
+
 def eliminate_hidden_users_from_db(**context):
     try:
-        client = MongoClient('mongo', 27017)
+        client = get_client()
         db = client['chadd_staging_db']
         members_collection = db['members']
         print("Connected to MongoDB successfully.")
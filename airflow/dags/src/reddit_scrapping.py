@@ -1,11 +1,15 @@
 import os
+import time
 from dotenv import load_dotenv
 import praw
+import prawcore
 import redis
-from pymongo import MongoClient
 import pandas as pd
 import datetime
 
+from src.utils.mongo_client import get_client
+from src.utils.rate_limiter import RateLimiter, parse_retry_after
+
 
 
 
@@ -25,13 +29,9 @@ def connect_to_mongo():
     # Load environment variables from .env file
     os.chdir('../../')      
    
-      # MongoDB connection details
-    mongo_host = 'mongo'  # Docker service name for MongoDB
-    mongo_port = 27017
-
     try:
         # Establish connection to MongoDB
-        client = MongoClient(host=mongo_host, port=mongo_port)
+        client = get_client()
 
     
         return client
@@ -94,6 +94,8 @@ def get_reddit_posts():
     Querykeywords=["adhd", "diagnose","energy", "brain", "test", "distracted", "forgetful", "doctor"
                   ,"work","task","disord","struggl","focu","dysfunct","forgot","lazi","prescrib","medic","medicin","pill","self diagnosis","self medication"]
     sortingTechniques=["relevance", "hot", "top", "new", "comments"]
+    # Reddit allows about 100 requests per minute for an OAuth client
+    limiter = RateLimiter(rate=1.5, burst=5, max_concurrency=1)
 
     # Subreddit to target
     subreddit_name = 'ADHD'
@@ -105,7 +107,7 @@ def get_reddit_posts():
     for keyword in Querykeywords:
         for sorting in sortingTechniques:
             print("Searching for keyword:", keyword, "using sorting technique:", sorting)
-            for post in subreddit.search(query=keyword,sort=sorting,syntax='cloudsearch',time_filter='all',limit=10):# 'hot', 'new', or 'top' post    
+            for post in search_with_rate_limiter(limiter, subreddit, query=keyword,sort=sorting,syntax='cloudsearch',time_filter='all',limit=10):# 'hot', 'new', or 'top' post    
                 datecreated=get_utc_time(post.created_utc)
                 year=datecreated.year
                 if(year>2019) and (r.sadd('reddit_posts', post.id)):
@@ -134,6 +136,29 @@ def get_reddit_posts():
     #print(posts)
     return None
 
+def search_with_rate_limiter(limiter, subreddit, **search_params):
+    # Run a subreddit search through the rate limiter, retrying when Reddit throttles us or fails
+    for attempt in range(limiter.max_retries + 1):
+        limiter.acquire()
+        # The slot is always given back, None records any other exception as a failed request
+        status_code, retry_after = None, None
+        try:
+            posts = list(subreddit.search(**search_params))
+            status_code = 200
+        except (prawcore.exceptions.TooManyRequests, prawcore.exceptions.ServerError) as e:
+            status_code = e.response.status_code
+            retry_after = parse_retry_after(e.response.headers.get('Retry-After'))
+            if attempt == limiter.max_retries:
+                raise
+            print(f"Reddit returned {e.response.status_code}, retrying ({attempt + 1}/{limiter.max_retries})...")
+        finally:
+            limiter.release(status_code, retry_after)
+
+        if status_code == 200:
+            return posts
+        # Back off after the slot is given back, so that other requests are not blocked while waiting
+        time.sleep(limiter.retry_delay(attempt, retry_after))
+
 def test_redis():
     r=connect_to_redis()
     print(r.keys())
@@ -154,15 +179,12 @@ def store_reddit_posts_locally(posts):
     return df
 
 def mongo_example_task():
-    # MongoDB connection details
-    mongo_host = 'mongo'  # Docker service name for MongoDB
-    mongo_port = 27017
     database_name = 'airflow_db'
     collection_name = 'example_collection'
 
     try:
         # Establish connection to MongoDB
-        client = MongoClient(host=mongo_host, port=mongo_port)
+        client = get_client()
 
         # Access database and collection
         db = client[database_name]
@@ -177,9 +199,6 @@ def mongo_example_task():
         result = collection.find_one({"_id": insert_result.inserted_id})
         print(f"Retrieved document: {result}")
 
-        # Close the MongoDB connection
-        client.close()
-
     except Exception as e:
         print(f"Failed to connect to MongoDB: {e}")
         raise
@@ -0,0 +1,163 @@
+# Offline tests of the scraper against the mock HealthUnlocked server.
+# Run from airflow/dags: python -m pytest src/test_chadd_scraper_offline.py
+from datetime import datetime
+
+import pytest
+
+import src.chadd.chadd_scrap as chadd_scrap
+from src.chadd.chadd_scrap import ChaddScraper
+from src.chadd.mock_server import MockHealthUnlockedServer
+from src.chadd.models.post import Post
+from src.chadd.models.user import User
+from src.chadd.session import SessionManager
+from src.utils.fast_json import HEALTHUNLOCKED_DATE_FORMAT, parse_iso_datetime
+from src.utils.http_cache import ResponseCache
+from src.utils.rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def server():
+    with MockHealthUnlockedServer() as server:
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    # Retry rounds back off with time.sleep, which would only slow the tests down
+    monkeypatch.setattr(chadd_scrap.time, 'sleep', lambda seconds: None)
+
+
+def logged_in_scraper(server, **kwargs) -> ChaddScraper:
+    scraper = ChaddScraper(email='test@example.com', password='test', base_url=server.url, **kwargs)
+    scraper.login()
+    return scraper
+
+
+def test_get_posts_ids_concurrent_matches_sequential(server):
+    scraper = logged_in_scraper(server)
+    sequential = scraper.get_posts_ids(start_date='2019-11', end_date='2020-02', max_workers=1)
+    concurrent = scraper.get_posts_ids(start_date='2019-11', end_date='2020-02', max_workers=4)
+
+    assert len(sequential) == 4 * server.posts_per_month
+    assert concurrent == sequential
+
+
+def test_get_posts_ids_retries_failed_months(server):
+    server.error_rate = 0.3
+    scraper = logged_in_scraper(server)
+    posts_by_month = scraper.get_posts_ids_by_month(start_date='2019-01', end_date='2019-12', max_workers=4, retries=20)
+
+    assert list(posts_by_month) == [f'2019-{month:02d}' for month in range(1, 13)]
+    assert all(len(month_ids) == server.posts_per_month for month_ids in posts_by_month.values())
+    assert server.hits['latest'] > 12
+
+
+def test_get_posts_ids_raises_when_months_keep_failing(server):
+    scraper = logged_in_scraper(server)
+    server.error_rate = 1.0
+    with pytest.raises(Exception, match='Failed to fetch posts for 2019-01'):
+        scraper.get_posts_ids(start_date='2019-01', end_date='2019-02', retries=2)
+
+
+def test_get_posts_details_tags_results_and_errors(server):
+    scraper = logged_in_scraper(server)
+    results = scraper.get_posts_details([150000001, 150000002, 150000003], max_workers=2)
+
+    assert [post_id for post_id, _, _ in results] == [150000001, 150000002, 150000003]
+    assert all(isinstance(post, Post) and post.post_id == post_id and error is None for post_id, post, error in results)
+
+    server.error_rate = 1.0
+    post_id, post, error = scraper.get_posts_details([150000004])[0]
+    assert post_id == 150000004 and post is None and error is not None
+
+
+def test_iter_user_details(server):
+    scraper = logged_in_scraper(server)
+    users = list(scraper.iter_user_details(['QuietCactus', 'BlueKettle'], max_workers=2))
+
+    assert [username for username, _, _ in users] == ['QuietCactus', 'BlueKettle']
+    assert all(isinstance(user, User) and user.username == username for username, user, _ in users)
+
+
+@pytest.mark.parametrize('total_members', [0, 5, 12, 30, 250])
+def test_get_all_members_stops_at_the_real_end(server, total_members):
+    server.total_members = total_members
+    scraper = logged_in_scraper(server)
+    members = scraper.get_all_members(max_workers=4)
+
+    assert len(members) == total_members
+    assert len(set(members)) == total_members
+
+
+def test_response_cache_serves_repeated_requests(server, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    scraper = logged_in_scraper(server, cache=cache)
+
+    first = scraper.get_post_details(150000001)
+    second = scraper.get_post_details(150000001)
+
+    assert server.hits['post'] == 1
+    assert second.to_dict() == first.to_dict()
+
+
+def test_rate_limiter_retries_throttled_requests(server):
+    server.throttle_rate = 0.3
+    server.retry_after = 0
+    rate_limiter = RateLimiter(rate=1000, burst=8, max_concurrency=8, base_delay=0.01, max_retries=20)
+    scraper = logged_in_scraper(server, rate_limiter=rate_limiter)
+
+    results = scraper.get_posts_details(list(range(150000000, 150000040)), max_workers=8)
+
+    assert all(error is None for _, _, error in results)
+    assert server.hits['post'] > 40
+
+
+def test_session_manager_reuses_and_renews_the_session(server, tmp_path):
+    cookie_file = str(tmp_path / 'cookies.json')
+    session_manager = SessionManager(cookie_file, email='test@example.com', password='test', base_url=server.url)
+
+    session_manager.get_scraper()
+    scraper = session_manager.get_scraper()
+    assert server.hits['session'] == 1
+
+    # The session expires mid-run: the scraper logs in once and carries on
+    server.expire_sessions()
+    results = scraper.get_posts_details(list(range(150000000, 150000010)), max_workers=4)
+
+    assert all(error is None for _, _, error in results)
+    assert server.hits['session'] == 2
+
+
+def test_response_authors_are_shared_between_responses(server):
+    scraper = logged_in_scraper(server)
+    first, second = scraper.get_post_details(150000001), scraper.get_post_details(150000002)
+
+    authors = {response.author.username: response.author for response in first.responses}
+    assert all(response.author is authors[response.author.username] for response in second.responses)
+    assert not hasattr(first.responses[0], '__dict__')
+    with pytest.raises(AttributeError):
+        first.responses[0].author.gender = 'female'
+    first.author.gender = 'female'
+
+
+@pytest.mark.parametrize('value', ['2020-01-03T09:12:44.000Z', '2019-12-31T23:59:59.999Z', '2020-01-03T09:12:44.5Z'])
+def test_parse_iso_datetime_matches_strptime(value):
+    assert parse_iso_datetime(value) == datetime.strptime(value, HEALTHUNLOCKED_DATE_FORMAT)
+
+
+def test_post_to_dict_stores_native_dates(server):
+    scraper = logged_in_scraper(server)
+    document = scraper.get_post_details(150000001).to_dict()
+
+    assert isinstance(document['date_created'], datetime) and isinstance(document['post_id'], int)
+    assert all(isinstance(response['date_created'], datetime) for response in document['responses'])
+
+
+def test_post_responses_can_be_stored_apart(server):
+    scraper = logged_in_scraper(server)
+    post = scraper.get_post_details(150000001)
+
+    assert 'responses' not in post.to_dict(include_responses=False)
+    responses = post.responses_to_dicts()
+    assert len(responses) == len(post.responses)
+    assert all(response['post_id'] == post.post_id for response in responses)
@@ -0,0 +1,52 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+
+def map_concurrently(func: Callable, items: Iterable, max_workers: int = 8) -> List[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    Apply func to every item using a bounded thread pool.
+
+    :param func: The function to call for each item
+    :param items: The items to process
+    :param max_workers: The maximum number of calls running at the same time
+    :return: A list of (item, result, error) tuples, in the same order as the items.
+             Exactly one of result and error is set for each item.
+    """
+    return list(imap_concurrently(func, items, max_workers=max_workers))
+
+
+def imap_concurrently(func: Callable, items: Iterable, max_workers: int = 8,
+                      window: Optional[int] = None) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    Lazy version of map_concurrently. Items are consumed as results are yielded, so that at most
+    window calls are submitted but not yet yielded, and memory stays flat on long inputs.
+
+    :param func: The function to call for each item
+    :param items: The items to process, can be a generator
+    :param max_workers: The maximum number of calls running at the same time
+    :param window: The maximum number of pending results (defaults to twice max_workers)
+    :return: An iterator of (item, result, error) tuples, in the same order as the items.
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield _call(func, item)
+        return
+
+    window = window or 2 * max_workers
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(_call, func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def _call(func: Callable, item) -> Tuple[Any, Any, Optional[Exception]]:
+    try:
+        return item, func(item), None
+    except Exception as e:
+        return item, None, e
@@ -0,0 +1,97 @@
+import os
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from src.utils.concurrency import imap_concurrently
+
+# Requests sent to Ollama at the same time. The ollama container should process as many
+# in parallel (OLLAMA_NUM_PARALLEL), otherwise they only queue up server-side.
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv('OLLAMA_MAX_IN_FLIGHT', '4'))
+
+# Every labelled document records the version of each stage that labelled it, in enrichment_versions.<stage>.
+# Bump the version of a stage when its model, modelfile or the parsing of its answers changes, the next run
+# then labels the whole collection again. Otherwise only the new documents are labelled.
+VERSIONS_FIELD = 'enrichment_versions'
+ENRICHMENT_VERSIONS = {
+    'sentiment': 1,
+    'self_diagnosis': 1,
+    'post_classifier': 1,
+}
+
+# Fallback labels (model error, invalid answer) are not stamped and count one more attempt in
+# enrichment_attempts.<stage> instead. After max_attempts the document is no longer selected,
+# so that a text the model always fails on doesn't cost a call on every run.
+ATTEMPTS_FIELD = 'enrichment_attempts'
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def enrich_concurrently(name: str, classify: Callable, documents: Iterable,
+                        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                        log_every: int = 100) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    Run classify on every document with at most max_in_flight calls in flight, and log the throughput
+    in documents per second, to size max_in_flight against the LLM server.
+
+    :param name: The name of the enrichment stage, used in the logs
+    :param classify: The function called with each document, usually one LLM request
+    :param documents: The documents to classify, can be a cursor
+    :param max_in_flight: The maximum number of classify calls running at the same time
+    :param log_every: Log the throughput every log_every documents
+    :return: An iterator of (document, result, error) tuples in the same order as the documents.
+             error holds the exception raised by classify, result is None in that case.
+    """
+    started_at = time.perf_counter()
+    processed = 0
+
+    for document, result, error in imap_concurrently(classify, documents, max_workers=max_in_flight):
+        processed += 1
+        if processed % log_every == 0:
+            elapsed = time.perf_counter() - started_at
+            print(f"{name}: {processed} documents, {processed / elapsed:.2f} docs/s")
+        yield document, result, error
+
+    elapsed = time.perf_counter() - started_at
+    rate = processed / elapsed if elapsed else 0.0
+    print(f"{name}: {processed} documents in {elapsed:.1f}s, {rate:.2f} docs/s with {max_in_flight} in flight")
+
+
+def pending_query(stage: str, labels: List[str], version: Optional[int] = None,
+                  max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> dict:
+    """
+    Query of the documents a stage still has to label: one of its labels is missing, or the document was
+    labelled by an older version of the stage (or before versions were recorded), and the stage fell back
+    less than max_attempts times on it.
+    Each clause of the $or is served by an index, see INDEXES.
+
+    :param stage: The name of the stage in ENRICHMENT_VERSIONS
+    :param labels: The fields written by the stage
+    :param version: The current version of the stage, ENRICHMENT_VERSIONS[stage] by default
+    :param max_attempts: The number of fallbacks after which a document is given up on
+    :return: The filter to pass to find
+    """
+    version = ENRICHMENT_VERSIONS[stage] if version is None else version
+    # $not $gte instead of $lt, so that documents without a version or attempts match too
+    return {'$or': [{label: None} for label in labels] +
+                   [{f'{VERSIONS_FIELD}.{stage}': {'$not': {'$gte': version}}}],
+            f'{ATTEMPTS_FIELD}.{stage}': {'$not': {'$gte': max_attempts}}}
+
+
+def version_stamp(stage: str) -> dict:
+    """
+    :return: The fields to $set along with the labels, recording the version of the stage that wrote them
+    """
+    return {f'{VERSIONS_FIELD}.{stage}': ENRICHMENT_VERSIONS[stage]}
+
+
+def enrichment_update(stage: str, labels: dict, answered: bool) -> dict:
+    """
+    :param stage: The name of the stage in ENRICHMENT_VERSIONS
+    :param labels: The fields written by the stage
+    :param answered: False when the labels are fallbacks after an error or an invalid answer
+    :return: The update of a labelled document: the labels with the version of the stage and no failed
+             attempts when the model answered, otherwise the fallback labels and one more failed attempt
+    """
+    attempts = f'{ATTEMPTS_FIELD}.{stage}'
+    if answered:
+        return {'$set': {**labels, **version_stamp(stage)}, '$unset': {attempts: ''}}
+    return {'$set': labels, '$inc': {attempts: 1}}
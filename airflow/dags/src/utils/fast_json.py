@@ -0,0 +1,41 @@
+import json
+from datetime import datetime
+from typing import Union
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib decoder gives the same result, only slower
+    orjson = None
+
+HEALTHUNLOCKED_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def loads(data: Union[bytes, str]):
+    """
+    Decode a JSON document, with orjson when it is installed.
+
+    :param data: The raw JSON, e.g. the content of a response
+    :return: The decoded document
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_iso_datetime(value: str) -> datetime:
+    """
+    Parse a HealthUnlocked timestamp such as 2020-01-03T09:12:44.000Z into a naive UTC datetime.
+    datetime.fromisoformat is implemented in C but only accepts the trailing Z from Python 3.11,
+    so it is stripped first, and anything unusual goes through strptime.
+
+    :param value: The timestamp
+    :return: The same datetime strptime would give with HEALTHUNLOCKED_DATE_FORMAT
+    """
+    if len(value) == 24 and value[-1] == 'Z':
+        try:
+            return datetime.fromisoformat(value[:-1])
+        except ValueError:
+            pass
+    return datetime.strptime(value, HEALTHUNLOCKED_DATE_FORMAT)
@@ -0,0 +1,159 @@
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+DAY = 24 * 60 * 60
+
+# Time to live of the cached responses, per endpoint (regex matched against the URL).
+# URLs that don't match any pattern are never cached.
+DEFAULT_TTLS = {
+    r"/private/posts/[^/]+/\d+$": 7 * DAY,
+    r"/private/user/profile/[^/?]+$": 30 * DAY,
+}
+
+
+class CachedResponse:
+    def __init__(self, url: str, body: bytes, etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def to_response(self) -> requests.Response:
+        """
+        Rebuild a requests.Response so that callers can't tell a cache hit from a network response.
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.url = self.url
+        response._content = self.body
+        response.headers["X-Cache"] = "HIT"
+        if self.etag:
+            response.headers["ETag"] = self.etag
+        if self.last_modified:
+            response.headers["Last-Modified"] = self.last_modified
+        return response
+
+
+class ResponseCache:
+    def __init__(self, path: str = "http_cache.sqlite", max_size: int = 512 * 1024 * 1024,
+                 ttls: Optional[Dict[str, int]] = None):
+        """
+        Persistent HTTP response cache stored in a SQLite file, keyed by URL.
+        Entries are evicted in least-recently-used order once the cache grows over max_size.
+
+        :param path: Path of the SQLite file
+        :param max_size: Maximum total size of the cached bodies, in bytes
+        :param ttls: Time to live in seconds for each URL pattern (defaults to DEFAULT_TTLS)
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls or DEFAULT_TTLS).items()]
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY,"
+            " body BLOB NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        # Running total of the cached bodies, kept up to date by put and _evict so that a write doesn't sum the
+        # whole table. It lives in the file rather than in memory because several tasks can share the cache.
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER NOT NULL)")
+        self._connection.execute(
+            "INSERT OR IGNORE INTO meta (id, total_size) SELECT 0, COALESCE(SUM(size), 0) FROM responses"
+        )
+        self._connection.commit()
+
+    def ttl_for(self, url: str) -> int:
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return 0
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        return time.time() - entry.fetched_at < self.ttl_for(entry.url)
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._connection.commit()
+
+        body, etag, last_modified, fetched_at = row
+        return CachedResponse(url, body, etag, last_modified, fetched_at)
+
+    def put(self, url: str, body: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            # Write lock up front, so that another process can't change the total between the read and the update
+            self._connection.execute("BEGIN IMMEDIATE")
+            replaced = self._connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (url, body, etag, last_modified, fetched_at, accessed_at, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, now, now, len(body)),
+            )
+            self._connection.execute(
+                "UPDATE meta SET total_size = total_size + ? WHERE id = 0", (len(body) - (replaced[0] if replaced else 0),)
+            )
+            self._evict()
+            self._connection.commit()
+
+    def touch(self, url: str) -> None:
+        """
+        Mark an entry as fetched now, after the server confirmed it didn't change.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url)
+            )
+            self._connection.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT total_size FROM meta WHERE id = 0").fetchone()[0]
+
+    def _evict(self) -> None:
+        total = self._connection.execute("SELECT total_size FROM meta WHERE id = 0").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        # Least recently used first, read lazily since only the oldest entries are needed
+        evicted = []
+        freed = 0
+        for url, size in self._connection.execute("SELECT url, size FROM responses ORDER BY accessed_at"):
+            if total - freed <= self.max_size:
+                break
+            evicted.append((url,))
+            freed += size
+
+        self._connection.executemany("DELETE FROM responses WHERE url = ?", evicted)
+        self._connection.execute("UPDATE meta SET total_size = total_size - ? WHERE id = 0", (freed,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> 'ResponseCache':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
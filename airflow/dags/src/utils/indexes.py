@@ -0,0 +1,175 @@
+import datetime
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from src.utils.enrichment import ENRICHMENT_VERSIONS, VERSIONS_FIELD, pending_query
+from src.utils.mongo_client import get_client
+
+# Indexes required by the queries of the pipeline, per (database, collection).
+# Partial indexes only hold the documents still waiting for a step, so they stay small.
+INDEXES = {
+    ('chadd_ingestion_db', 'posts'): [
+        IndexModel([('post_id', ASCENDING)], unique=True),
+        IndexModel([('month', ASCENDING)]),
+        IndexModel([('status', ASCENDING)]),
+    ],
+    ('chadd_ingestion_db', 'members'): [
+        IndexModel([('username', ASCENDING)], unique=True),
+        IndexModel([('status', ASCENDING)]),
+    ],
+    ('chadd_ingestion_db', 'watermarks'): [
+        IndexModel([('community', ASCENDING)], unique=True),
+    ],
+    ('chadd_staging_db', 'posts'): [
+        IndexModel([('post_id', ASCENDING)], unique=True),
+        IndexModel([('author.author_id', ASCENDING)]),
+        IndexModel([('date_created', ASCENDING)]),
+        IndexModel([('sentiment', ASCENDING)]),
+        IndexModel([('self-diagnosed', ASCENDING)]),
+        IndexModel([('self-medicated', ASCENDING)]),
+        # The enrichment stages select the posts labelled by an older version, see pending_query
+    ] + [IndexModel([(f'{VERSIONS_FIELD}.{stage}', ASCENDING)]) for stage in ENRICHMENT_VERSIONS],
+    ('chadd_staging_db', 'responses'): [
+        IndexModel([('post_id', ASCENDING), ('response_id', ASCENDING)], unique=True),
+        IndexModel([('author', ASCENDING)]),
+    ],
+    ('chadd_staging_db', 'members'): [
+        IndexModel([('username', ASCENDING)], unique=True),
+        # load_posts_to_prod_db looks the author of every post up by author_id
+        IndexModel([('author_id', ASCENDING)]),
+        IndexModel([('gender', ASCENDING)]),
+        IndexModel([('fetched_at', ASCENDING)]),
+        # Members seeded from post authors, whose profile is still to be fetched
+        IndexModel([('source', ASCENDING)]),
+    ],
+    ('Ingestion_db', 'reddit_ingestion'): [
+        IndexModel([('id', ASCENDING)]),
+        IndexModel([('staged', ASCENDING)], name='staged_pending', partialFilterExpression={'staged': 0}),
+    ],
+    ('Staging_db', 'reddit_llm'): [
+        IndexModel([('id', ASCENDING)]),
+        IndexModel([('augmented', ASCENDING)], name='augmented_pending', partialFilterExpression={'augmented': 0}),
+    ],
+    ('Production_db', 'posts'): [
+        IndexModel([('id', ASCENDING), ('Source', ASCENDING)], unique=True),
+        IndexModel([('created_at', ASCENDING)]),
+    ],
+    ('Production_db', 'members'): [
+        # load_members_to_prod_db merges on author_id
+        IndexModel([('author_id', ASCENDING)], unique=True),
+    ],
+    ('llm_cache', 'results'): [
+        # LLMCache.evict deletes the least recently used answers first
+        IndexModel([('accessed_at', ASCENDING)]),
+    ],
+}
+
+# The filters of the hot queries, checked with explain to catch the ones that scan whole collections
+HOT_QUERIES = {
+    ('chadd_ingestion_db', 'posts'): [
+        {'post_id': 0},
+        {'month': {'$gte': '2025-01'}},
+        {'status': {'$ne': 'done'}, 'attempts': {'$not': {'$gte': 3}}},
+    ],
+    ('chadd_ingestion_db', 'members'): [
+        {'username': ''},
+        {'status': {'$ne': 'done'}, 'attempts': {'$not': {'$gte': 3}}},
+    ],
+    ('chadd_staging_db', 'posts'): [
+        {'post_id': 0},
+        {'sentiment': 'negative'},
+        {'self-diagnosed': 'Yes'},
+        {'date_created': {'$gte': datetime.datetime(2025, 1, 1)}},
+        pending_query('sentiment', ['sentiment']),
+        pending_query('self_diagnosis', ['self-diagnosed', 'self-medicated']),
+        pending_query('post_classifier', ['sentiment', 'self-diagnosed', 'self-medicated']),
+    ],
+    ('chadd_staging_db', 'members'): [
+        {'author_id': 0},
+        {'gender': {'$in': [None, '', 'unknown']}},
+        {'fetched_at': {'$lt': datetime.datetime(2025, 1, 1)}},
+        {'source': 'post'},
+    ],
+    ('Ingestion_db', 'reddit_ingestion'): [
+        {'staged': 0},
+    ],
+    ('Staging_db', 'reddit_llm'): [
+        {'augmented': 0},
+        {'id': ''},
+    ],
+    ('Production_db', 'posts'): [
+        {'id': 0, 'Source': 'HealthUnlocked'},
+        {'created_at': {'$gte': datetime.datetime(2025, 1, 1)}},
+    ],
+}
+
+
+def ensure_indexes(databases=None) -> dict:
+    """
+    Create the indexes declared in INDEXES that are missing. Existing indexes are left as they are,
+    so this is cheap to run at the start of every DAG run.
+
+    :param databases: Only the collections of these databases, all of them when None
+    :return: The names of the indexes per collection
+    """
+    client = get_client()
+
+    created = {}
+    for (database, collection_name), indexes in INDEXES.items():
+        if databases is not None and database not in databases:
+            continue
+        collection = client[database][collection_name]
+        created[collection.full_name] = []
+        # One by one, so that a conflicting index does not prevent the others from being created
+        for index in indexes:
+            try:
+                created[collection.full_name] += collection.create_indexes([index])
+            except OperationFailure as e:
+                # Typically an index with the same name but other options, or duplicates under a unique index
+                print(f"Could not create index {index.document['name']} on {collection.full_name}: {e}")
+
+    for namespace, names in created.items():
+        print(f"{namespace}: {', '.join(names)}")
+    return created
+
+
+def find_collection_scans(databases=None) -> list:
+    """
+    Explain the hot queries of HOT_QUERIES and report the ones whose winning plan scans the whole collection.
+
+    :param databases: Only the collections of these databases, all of them when None
+    :return: A list of (namespace, filter) tuples of the queries doing a COLLSCAN
+    """
+    client = get_client()
+
+    scans = []
+    for (database, collection_name), filters in HOT_QUERIES.items():
+        if databases is not None and database not in databases:
+            continue
+        collection = client[database][collection_name]
+        for query in filters:
+            plan = collection.find(query).explain().get('queryPlanner', {}).get('winningPlan', {})
+            if _has_stage(plan, 'COLLSCAN'):
+                scans.append((collection.full_name, query))
+
+    for namespace, query in scans:
+        print(f"Collection scan on {namespace} for {query}")
+    if not scans:
+        print("Every hot query uses an index.")
+    return scans
+
+
+def ensure_indexes_func(**context):
+    databases = context.get('databases')
+    ensure_indexes(databases)
+    find_collection_scans(databases)
+
+
+def _has_stage(plan, stage) -> bool:
+    # Plans nest their stages in inputStage / inputStages / queryPlan depending on the server version
+    if isinstance(plan, dict):
+        return plan.get('stage') == stage or any(_has_stage(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_stage(value, stage) for value in plan)
+    return False
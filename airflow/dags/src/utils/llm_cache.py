@@ -0,0 +1,145 @@
+import datetime
+import hashlib
+import json
+import threading
+from collections import Counter
+from typing import Any, Optional
+
+import bson
+from pymongo.errors import PyMongoError
+
+from src.utils.mongo_client import get_client
+
+
+def normalize_text(text: str) -> str:
+    # Whitespace differences (trailing newlines, double spaces) don't change the answer of the model
+    return " ".join(text.split())
+
+
+class LLMCache:
+    def __init__(self, database: str = 'llm_cache', collection: str = 'results', max_size: int = 256 * 1024 * 1024):
+        """
+        Persistent cache of parsed LLM answers stored in MongoDB, keyed by a hash of the model, its
+        configuration (the Ollama modelfile, or the generation parameters of a hosted model) and the
+        normalised input text. A rerun, or the same text seen twice, is answered without calling the model,
+        and changing the modelfile changes every key, so stale answers are never served.
+        Entries are evicted in least-recently-used order once the cache grows over max_size,
+        using the accessed_at index declared in INDEXES.
+
+        :param database: The database of the cache collection
+        :param collection: The cache collection
+        :param max_size: Maximum total size of the cached answers, in bytes
+        """
+        self.collection = get_client()[database][collection]
+        self.max_size = max_size
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(model: str, configuration: str = '') -> str:
+        """
+        Identify a model and its configuration, the part of the key shared by all the inputs.
+        """
+        return hashlib.sha256(f"{model}\0{configuration}".encode()).hexdigest()
+
+    def ollama_fingerprint(self, client, model: str) -> Optional[str]:
+        """
+        Fingerprint of an Ollama model, including its modelfile (system prompt, parameters, base model).
+
+        :return: The fingerprint, or None when the model can't be inspected, in which case nothing should be cached
+        """
+        try:
+            modelfile = client.show(model)['modelfile']
+        except Exception as e:
+            print(f"Could not read the modelfile of {model}, its answers will not be cached: {e}")
+            return None
+        return self.fingerprint(model, modelfile)
+
+    @staticmethod
+    def key(fingerprint: str, text: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\0{normalize_text(text)}".encode()).hexdigest()
+
+    def get(self, fingerprint: Optional[str], text: str) -> Optional[Any]:
+        """
+        :return: The cached answer for text, or None on a miss
+        """
+        if fingerprint is None:
+            return None
+
+        try:
+            entry = self.collection.find_one_and_update(
+                {'_id': self.key(fingerprint, text)},
+                {'$set': {'accessed_at': datetime.datetime.utcnow()}, '$inc': {'hits': 1}},
+                projection={'result': 1},
+            )
+        except PyMongoError as e:
+            # The cache is an optimisation, the model is called as if it was a miss
+            print(f"LLM cache lookup failed: {e}")
+            entry = None
+        self._count('hits' if entry is not None else 'misses')
+        return entry['result'] if entry is not None else None
+
+    def put(self, fingerprint: Optional[str], text: str, model: str, result: Any) -> None:
+        if fingerprint is None:
+            return
+
+        now = datetime.datetime.utcnow()
+        try:
+            self.collection.replace_one(
+                {'_id': self.key(fingerprint, text)},
+                {
+                    'model': model,
+                    'result': result,
+                    'size': len(bson.encode({'result': result})),
+                    'created_at': now,
+                    'accessed_at': now,
+                    'hits': 0,
+                },
+                upsert=True,
+            )
+        except PyMongoError as e:
+            print(f"LLM cache write failed: {e}")
+            return
+        self._count('writes')
+
+    def size(self) -> int:
+        totals = list(self.collection.aggregate([{'$group': {'_id': None, 'size': {'$sum': '$size'}}}]))
+        return totals[0]['size'] if totals else 0
+
+    def evict(self) -> int:
+        """
+        Delete the least recently used answers until the cache fits in max_size.
+
+        :return: The number of evicted answers
+        """
+        total = self.size()
+        if total <= self.max_size:
+            return 0
+
+        evicted = []
+        for entry in self.collection.find({}, {'size': 1}).sort('accessed_at', 1):
+            if total <= self.max_size:
+                break
+            evicted.append(entry['_id'])
+            total -= entry['size']
+
+        for i in range(0, len(evicted), 10000):
+            self.collection.delete_many({'_id': {'$in': evicted[i:i + 10000]}})
+        self._count('evictions', len(evicted))
+        return len(evicted)
+
+    def report(self, name: str) -> dict:
+        """
+        Evict what no longer fits and print the hit/miss counters of this run.
+        """
+        self.evict()
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        hit_rate = stats.get('hits', 0) / lookups if lookups else 0.0
+        print(f"{name} LLM cache: {json.dumps(stats)}, hit rate {hit_rate:.0%}")
+        return stats
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
@@ -1,15 +1,19 @@
-from pymongo import MongoClient
-from pymongo.errors import BulkWriteError
+import datetime
+import time
 
+import bson
+from bson.errors import InvalidDocument
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DocumentTooLarge, OperationFailure
+
+from src.utils.indexes import ensure_indexes
+from src.utils.mongo_client import get_client
 
-def connect_to_mongo():
-    # MongoDB connection details
-    mongo_host = 'mongo'  # Docker service name for MongoDB
-    mongo_port = 27017
 
+def connect_to_mongo():
     try:
         # Establish connection to MongoDB
-        client = MongoClient(host=mongo_host, port=mongo_port)
+        client = get_client()
         client.list_database_names()
         return True
 
@@ -18,32 +22,35 @@ def connect_to_mongo():
         return False
 
 def clean_ingestion_db():
-    client = MongoClient('mongo', 27017)
+    client = get_client()
     db = client['chadd_ingestion_db']
     db.drop_collection('posts')
     db.drop_collection('members')
     print("Collections dropped successfully!")
 
 def clean_staging_db():
-    client = MongoClient('mongo', 27017)
+    client = get_client()
     db = client['chadd_staging_db']
     db.drop_collection('posts')
     db.drop_collection('members')
+    db.drop_collection('responses')
     print("Collections dropped successfully!")
 
 def prepare_ingestion_db():
-    client = MongoClient('mongo', 27017)
+    client = get_client()
     db = client['chadd_ingestion_db']
     post_collection = db['posts']
     member_collection = db['members']
 
     # Create a unique index on the post_id field
     post_collection.create_index('post_id', unique=True)
+    # Incremental runs select the posts listed from a given month
+    post_collection.create_index('month')
 
     return post_collection
 
 def insert_post_ids(post_ids):
-    client = MongoClient('mongo', 27017)
+    client = get_client()
     db = client['chadd_ingestion_db']
     post_collection = db['posts']
 
@@ -58,7 +65,7 @@ def insert_post_ids(post_ids):
         print(f"Duplicate entries found. Continuing with remaining insertions.")
 
 def insert_members(members):
-    client = MongoClient('mongo', 27017)
+    client = get_client()
     db = client['chadd_ingestion_db']
     member_collection = db['members']
     member_collection.create_index('username', unique=True)
@@ -73,59 +80,592 @@ def insert_members(members):
     except BulkWriteError as e:
         print(f"Duplicate entries found. Continuing with remaining insertions.")
 
-def get_post_ids():
-    client = MongoClient('mongo', 27017)
+def insert_post_ids_by_month(posts_by_month):
+    client = get_client()
     db = client['chadd_ingestion_db']
     post_collection = db['posts']
 
-    # Get the post_ids in batches
-    post_ids = []
-    for post in post_collection.find():
-        post_ids.append(post['post_id'])
+    # Upsert so that posts seen again in the look-back window are not duplicated
+    operations = [
+        # Posts listed again are set back to pending so that their details are fetched again. Failed posts
+        # keep their status and attempts, so that max_attempts still stops the ones that always fail
+        # (an update pipeline, the new status depends on the stored one).
+        UpdateOne(
+            {'post_id': post_id},
+            [{'$set': {
+                'post_id': post_id,
+                'month': month,
+                'status': {'$cond': [{'$eq': ['$status', 'failed']}, '$status', 'pending']},
+                'attempts': {'$cond': [{'$eq': ['$status', 'failed']}, '$attempts', 0]},
+            }}],
+            upsert=True,
+        )
+        for month, post_ids in posts_by_month.items() if post_ids
+        for post_id in post_ids
+    ]
+
+    if operations:
+        result = post_collection.bulk_write(operations, ordered=False)
+        print(f"Post IDs upserted: {result.upserted_count} new, {result.matched_count} already known.")
+
+def get_post_authors():
+    client = get_client()
+    db = client['chadd_staging_db']
+    post_collection = db['posts']
+
+    # Unique usernames of the post and response authors, computed server-side.
+    # Post authors come with the profile fields embedded in the post, response authors only have a username.
+    pipeline = [
+        {'$project': {'authors': {'$concatArrays': [
+            [{'username': '$author.username', 'profile': '$author'}],
+            {'$map': {
+                'input': {'$ifNull': ['$responses', []]},
+                'as': 'response',
+                'in': {'username': '$$response.author', 'profile': None},
+            }},
+        ]}}},
+        {'$unwind': '$authors'},
+        # Responses stored in their own collection (separate_responses), the collection may not exist
+        {'$unionWith': {'coll': 'responses', 'pipeline': [{'$project': {'authors.username': '$author'}}]}},
+        {'$match': {'authors.username': {'$nin': [None, '']}}},
+        # null sorts before documents, so $max keeps the embedded profile when there is one
+        {'$group': {'_id': '$authors.username', 'profile': {'$max': '$authors.profile'}}},
+    ]
+
+    return list(post_collection.aggregate(pipeline, allowDiskUse=True))
+
+def seed_members_from_posts(profiles):
+    client = get_client()
+    db = client['chadd_staging_db']
+    member_collection = db['members']
+    member_collection.create_index('username', unique=True)
+
+    # Only create the members that have no profile yet, a fetched profile is always more complete.
+    # The embedded author has no conditions: source 'post' and no fetched_at keep the profile pending,
+    # and the member is written again with source 'profile' once its profile is fetched.
+    operations = [
+        UpdateOne(
+            {'username': profile['username']},
+            {'$setOnInsert': dict(profile, source='post')},
+            upsert=True,
+        )
+        for profile in profiles
+    ]
+
+    if operations:
+        result = member_collection.bulk_write(operations, ordered=False)
+        print(f"{result.upserted_count} members created from the authors embedded in posts.")
+
+def mark_stale_profiles(max_age_days=None):
+    client = get_client()
+    staging_members = client['chadd_staging_db']['members']
+    ingestion_members = client['chadd_ingestion_db']['members']
+    staging_members.create_index('fetched_at')
+    staging_members.create_index('source')
+
+    # Members only known from the author embedded in a post always need their profile.
+    # With max_age_days, profiles fetched more than max_age_days ago are fetched again too.
+    conditions = [{'source': 'post'}]
+    if max_age_days is not None:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=max_age_days)
+        conditions += [{'fetched_at': {'$lt': cutoff}}, {'fetched_at': {'$exists': False}}]
+    stale = [
+        member['username'] for member in staging_members.find({'$or': conditions}, {'username': 1, '_id': 0})
+    ]
 
-    return post_ids
+    marked = 0
+    for i in range(0, len(stale), 10000):
+        result = ingestion_members.update_many(
+            {'username': {'$in': stale[i:i + 10000]}, 'status': 'done'},
+            {'$set': {'status': 'pending', 'attempts': 0}},
+        )
+        marked += result.modified_count
+
+    print(f"{marked} stale profiles will be fetched again.")
+
+def get_watermark(community):
+    client = get_client()
+    db = client['chadd_ingestion_db']
+    return db['watermarks'].find_one({'community': community})
+
+def set_watermark(community, last_month, last_post_id):
+    client = get_client()
+    db = client['chadd_ingestion_db']
+    watermark_collection = db['watermarks']
+    watermark_collection.create_index('community', unique=True)
+
+    watermark_collection.update_one(
+        {'community': community},
+        {'$set': {
+            'last_month': last_month,
+            'last_post_id': last_post_id,
+            'updated_at': datetime.datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+    print(f"Watermark for {community} set to {last_month} (post {last_post_id}).")
+
+def get_post_ids(since_month=None):
+    return list(iter_post_ids(since_month))
+
+def iter_post_ids(since_month=None, batch_size=5000):
+    """
+    Stream the post IDs of the ingestion database without loading the documents or the whole list.
+
+    :param since_month: Only the posts listed from this month onwards ('YYYY-MM'), for incremental runs
+    :param batch_size: The number of IDs fetched per round trip
+    :return: An iterator of post IDs
+    """
+    client = get_client()
+    db = client['chadd_ingestion_db']
+    post_collection = db['posts']
+
+    # Only the posts listed from since_month onwards when doing an incremental run
+    query = {'month': {'$gte': since_month}} if since_month else {}
+
+    return _iter_field(post_collection, 'post_id', query, batch_size)
 
 def get_members_usernames():
-    client = MongoClient('mongo', 27017)
+    return list(iter_members_usernames())
+
+def iter_members_usernames(batch_size=5000):
+    """
+    Stream the usernames of the ingestion database, see iter_post_ids.
+
+    :param batch_size: The number of usernames fetched per round trip
+    :return: An iterator of usernames
+    """
+    client = get_client()
     db = client['chadd_ingestion_db']
     member_collection = db['members']
 
-    # Get the usernames in batches
-    usernames = []
-    for member in member_collection.find():
-        usernames.append(member['username'])
+    return _iter_field(member_collection, 'username', {}, batch_size)
+
+def _iter_field(collection, field, query, batch_size):
+    # Pages of batch_size documents in _id order, only the field and _id go over the wire. Each page is a
+    # new query starting after the last _id read, so no cursor stays open while the caller works through
+    # the IDs (idle cursors time out after 10 minutes), and status updates made meanwhile don't move the
+    # documents still to be read.
+    last_id = None
+    while True:
+        page_query = query if last_id is None else {'$and': [query, {'_id': {'$gt': last_id}}]}
+        page = list(collection.find(page_query, {field: 1}).sort('_id', 1).limit(batch_size))
+        for document in page:
+            if field in document:
+                yield document[field]
+        if len(page) < batch_size:
+            return
+        last_id = page[-1]['_id']
+
+def get_pending_post_ids(max_attempts=3):
+    return list(iter_pending_post_ids(max_attempts))
+
+def iter_pending_post_ids(max_attempts=3, batch_size=5000):
+    """
+    Stream the IDs of the posts to fetch: not staged yet, and failed less than max_attempts times.
+
+    :param max_attempts: The number of failed fetches after which a post is given up on
+    :param batch_size: The number of IDs fetched per round trip
+    :return: An iterator of post IDs
+    """
+    client = get_client()
+    db = client['chadd_ingestion_db']
+    post_collection = db['posts']
+
+    # Posts already in the staging database don't need to be fetched again
+    _mark_staged_as_done(post_collection, client['chadd_staging_db']['posts'], 'post_id')
+
+    # No month restriction in incremental runs either: the months listed by the run are pending again, and the
+    # posts of earlier months that failed or were left pending by an interrupted run must be fetched too
+    query = _pending_query(max_attempts)
+    print(f"{post_collection.count_documents(query)} posts to fetch.")
+    return _iter_field(post_collection, 'post_id', query, batch_size)
+
+def get_pending_usernames(max_attempts=3):
+    return list(iter_pending_usernames(max_attempts))
+
+def iter_pending_usernames(max_attempts=3, batch_size=5000):
+    """
+    Stream the usernames of the members to fetch, see iter_pending_post_ids.
+
+    :param max_attempts: The number of failed fetches after which a member is given up on
+    :param batch_size: The number of usernames fetched per round trip
+    :return: An iterator of usernames
+    """
+    client = get_client()
+    db = client['chadd_ingestion_db']
+    member_collection = db['members']
+
+    # Members seeded from a post author are staged without their profile, they still have to be fetched
+    _mark_staged_as_done(member_collection, client['chadd_staging_db']['members'], 'username',
+                         staged_query={'source': {'$ne': 'post'}})
+
+    query = _pending_query(max_attempts)
+    print(f"{member_collection.count_documents(query)} members to fetch.")
+    return _iter_field(member_collection, 'username', query, batch_size)
+
+def mark_post_ids_status(done=(), failed=None):
+    client = get_client()
+    db = client['chadd_ingestion_db']
+    _mark_status(db['posts'], 'post_id', done, failed or {})
+
+def mark_usernames_status(done=(), failed=None):
+    client = get_client()
+    db = client['chadd_ingestion_db']
+    _mark_status(db['members'], 'username', done, failed or {})
 
-    return usernames
+def _pending_query(max_attempts):
+    # Everything not done yet, except the items that already failed max_attempts times
+    return {'status': {'$ne': 'done'}, 'attempts': {'$not': {'$gte': max_attempts}}}
 
-def insert_post_details(posts):
-    client = MongoClient('mongo', 27017)
+def _mark_staged_as_done(ingestion_collection, staging_collection, key, chunk_size=10000, staged_query=None):
+    # Set difference between the ingestion and staging collections, both indexed on key.
+    # Only items without a status are reconciled: items explicitly set back to pending
+    # (e.g. by an incremental run) must be fetched again even if they are already staged.
+    # The staging collection gets its unique index on key from the writers and ensure_indexes
+    ingestion_collection.create_index('status')
+
+    staged = staging_collection.distinct(key, staged_query or {})
+    marked = 0
+    for i in range(0, len(staged), chunk_size):
+        result = ingestion_collection.update_many(
+            {key: {'$in': staged[i:i + chunk_size]}, 'status': {'$exists': False}},
+            {'$set': {'status': 'done', 'attempts': 0}},
+        )
+        marked += result.modified_count
+
+    if marked:
+        print(f"{marked} items already staged, marked as done.")
+
+def _mark_status(collection, key, done, failed):
+    operations = [UpdateOne({key: value}, {'$set': {'status': 'done'}}) for value in done]
+    operations += [
+        UpdateOne({key: value}, {'$set': {'status': 'failed', 'last_error': str(error)}, '$inc': {'attempts': 1}})
+        for value, error in failed.items()
+    ]
+
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+def insert_post_details(posts, separate_responses=False):
+    client = get_client()
     db = client['chadd_staging_db']
     post_collection = db['posts']
 
-    # Prepare the documents for bulk insertion
-    post_docs = [post.to_dict() for post in posts]
+    # Replace the posts already staged by an earlier attempt instead of failing on them or duplicating them
+    post_docs = [post.to_dict(include_responses=not separate_responses) for post in posts]
+    writer = BulkUpsertWriter(post_collection, keys=['post_id'], replace=True)
+    totals = writer.write(post_docs)
+    print(f"Post details inserted: {totals}")
 
-    # Use insert_many for bulk insertion
-    post_collection.insert_many(post_docs)
-    print("Post details inserted successfully!")
+    failed = dict(writer.failed)
+    if separate_responses:
+        failed.update(upsert_responses(posts))
+    return failed
+
+def upsert_post_details(posts, separate_responses=False):
+    client = get_client()
+    db = client['chadd_staging_db']
+    post_collection = db['posts']
+
+    # Update the posts fetched again (late edits, new responses) instead of duplicating them.
+    # $set keeps the fields added by the staging enrichment tasks.
+    post_docs = [post.to_dict(include_responses=not separate_responses) for post in posts]
+    writer = BulkUpsertWriter(post_collection, keys=['post_id'])
+    totals = writer.write(post_docs)
+    print(f"Post details upserted: {totals}")
+
+    failed = dict(writer.failed)
+    if separate_responses:
+        failed.update(upsert_responses(posts))
+    return failed
+
+def upsert_responses(posts, chunk_size=1000):
+    """
+    Store the responses of the posts in chadd_staging_db.responses, one document per response,
+    instead of embedding them in the post documents. Popular threads would otherwise make the post
+    documents huge, and every read of the posts would page the responses in.
+
+    :param posts: The posts whose responses are stored
+    :param chunk_size: The number of responses sent per bulk write
+    :return: The IDs of the posts with responses that were not written, mapped to the error
+    """
+    client = get_client()
+    db = client['chadd_staging_db']
+    response_collection = db['responses']
+    # Member discovery groups the responses by author
+    response_collection.create_index('author')
+
+    writer = BulkUpsertWriter(response_collection, keys=['post_id', 'response_id'], batch_size=chunk_size)
+    totals = writer.write(response for post in posts for response in post.responses_to_dicts())
+    print(f"Responses upserted: {totals}")
+
+    return {post_id: error for (post_id, _), error in writer.failed.items()}
+
+def upsert_members_details(members):
+    client = get_client()
+    db = client['chadd_staging_db']
+    member_collection = db['members']
+
+    fetched_at = datetime.datetime.utcnow()
+    # source 'profile' replaces the 'post' marker of the members seeded from post authors
+    member_docs = [dict(member.to_dict(), fetched_at=fetched_at, source='profile') for member in members]
+    writer = BulkUpsertWriter(member_collection, keys=['username'])
+    totals = writer.write(member_docs)
+    print(f"Member details upserted: {totals}")
+    return writer.failed
 
 def insert_members_details(members):
-    client = MongoClient('mongo', 27017)
+    client = get_client()
     db = client['chadd_staging_db']
     member_collection = db['members']
 
-    # Prepare the documents for bulk insertion
-    member_docs = [member.to_dict() for member in members]
+    fetched_at = datetime.datetime.utcnow()
+    # source 'profile' replaces the 'post' marker of the members seeded from post authors
+    member_docs = [dict(member.to_dict(), fetched_at=fetched_at, source='profile') for member in members]
+    writer = BulkUpsertWriter(member_collection, keys=['username'], replace=True)
+    totals = writer.write(member_docs)
+    print(f"Member details inserted: {totals}")
+    return writer.failed
 
-    # Use insert_many for bulk insertion
-    member_collection.insert_many(member_docs, ordered=False)
-    print("Member details inserted successfully!")
+class BatchSink:
+    def __init__(self, write, batch_size=500, flush_interval=60):
+        """
+        Buffer documents and hand them to write in batches, every batch_size documents
+        or every flush_interval seconds, whichever comes first.
+
+        :param write: The function called with each batch (e.g. insert_post_details)
+        :param batch_size: The maximum number of buffered documents
+        :param flush_interval: The maximum number of seconds a document stays buffered
+        """
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.flushed = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, document):
+        self.buffer.append(document)
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.write(self.buffer)
+            self.flushed += len(self.buffer)
+            self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Flush what was gathered even if the loop failed, so that progress is not lost
+        self.flush()
+
+# Largest document MongoDB stores (16 MB), larger ones are rejected by pymongo before being sent
+MAX_DOCUMENT_SIZE = 16 * 1024 * 1024
+
+class BulkUpsertWriter:
+    def __init__(self, collection, keys, batch_size=1000, replace=False):
+        """
+        Write documents as unordered upserts on their natural key, in batches of batch_size.
+        Writing the same documents again matches them instead of duplicating them, and leaves
+        unchanged documents untouched. A failed document (e.g. too large) does not stop the others,
+        its key is recorded in failed so that the caller doesn't take it as written.
+
+        :param collection: The collection to write to
+        :param keys: The fields identifying a document, a unique index is created on them
+        :param batch_size: The number of operations sent per bulk write
+        :param replace: Replace the whole stored document (ReplaceOne) instead of only
+                        setting the written fields ($set), which keeps the fields added later
+        """
+        self.collection = collection
+        self.keys = list(keys)
+        self.batch_size = batch_size
+        self.replace = replace
+        self.totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+        # Key of every failed document (the value itself for a single key field, a tuple otherwise) -> error
+        self.failed = {}
+        self._ensure_unique_index()
+
+    def write(self, documents):
+        """
+        :param documents: The documents to write, can be a generator
+        :return: The inserted, updated, unchanged and failed counts over all the writes of this writer
+        """
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                self.failed.update(self._write_batch(batch))
+                batch = []
+        if batch:
+            self.failed.update(self._write_batch(batch))
+        return dict(self.totals)
+
+    def _key(self, document):
+        if len(self.keys) == 1:
+            return document.get(self.keys[0])
+        return tuple(document.get(field) for field in self.keys)
+
+    def _operation(self, document):
+        key = {field: document.get(field) for field in self.keys}
+        if self.replace:
+            return ReplaceOne(key, document, upsert=True)
+        return UpdateOne(key, {'$set': document}, upsert=True)
+
+    def _write_batch(self, batch):
+        """
+        :return: The keys of the documents of the batch that were not written, mapped to their error
+        """
+        failed = {}
+        try:
+            operations = [self._operation(document) for document in batch]
+            result = self.collection.bulk_write(operations, ordered=False)
+        except (DocumentTooLarge, InvalidDocument):
+            # Raised client-side before anything is sent, for the whole batch: find the culprits
+            # and write the other documents without them
+            written = []
+            for document in batch:
+                try:
+                    if len(bson.encode(document)) > MAX_DOCUMENT_SIZE:
+                        raise DocumentTooLarge(f"document is larger than {MAX_DOCUMENT_SIZE} bytes")
+                except (DocumentTooLarge, InvalidDocument) as e:
+                    failed[self._key(document)] = str(e)
+                else:
+                    written.append(document)
+            self.totals['failed'] += len(failed)
+            print(f"{len(failed)} documents can't be stored in {self.collection.full_name}: {list(failed)[:10]}")
+            if written:
+                failed.update(self._write_batch(written))
+            return failed
+        except BulkWriteError as e:
+            # Unordered: everything but the failed operations was applied
+            details = e.details
+            for error in details.get('writeErrors', []):
+                failed[self._key(batch[error['index']])] = error.get('errmsg')
+            counts = {
+                'inserted': details.get('nUpserted', 0),
+                'updated': details.get('nModified', 0),
+                'unchanged': details.get('nMatched', 0) - details.get('nModified', 0),
+                'failed': len(failed),
+            }
+            print(f"{counts['failed']} writes failed in {self.collection.full_name}, "
+                  f"first error: {(details.get('writeErrors') or [{}])[0].get('errmsg')}")
+        else:
+            counts = {
+                'inserted': result.upserted_count,
+                'updated': result.modified_count,
+                'unchanged': result.matched_count - result.modified_count,
+                'failed': 0,
+            }
+
+        for name, count in counts.items():
+            self.totals[name] += count
+        print(f"Batch of {len(batch)} written to {self.collection.full_name}: {counts}")
+        return failed
+
+    def _ensure_unique_index(self):
+        try:
+            self.collection.create_index([(field, 1) for field in self.keys], unique=True)
+        except OperationFailure as e:
+            # Duplicates written by older runs, the writes still work but are slower
+            print(f"Could not create a unique index on {self.keys} in {self.collection.full_name}: {e}")
 
 def create_production_db():
-    client = MongoClient('mongo', 27017)
-    db = client['Production_db']
-    post_collection = db['posts']
-    post_collection.create_index(['id', 'Source'], unique=True)
-    member_collection = db['members']
+    # The indexes of the production collections are declared in src/utils/indexes.py
+    ensure_indexes(['Production_db'])
+
+    print("Production database created successfully!")
+
+def migrate_to_native_types(batch_size=1000):
+    """
+    One-off migration of the documents written before the models stored native types:
+    dates stored as ISO strings become BSON dates, and IDs stored as strings become integers.
+    Documents already migrated are not matched, so the migration can be run again safely.
+    Values that can't be converted are left as they are, counted and reported at the end.
+
+    :param batch_size: The number of updates sent per bulk write
+    :return: The number of values left unconverted, per collection
+    """
+    client = get_client()
+
+    migrations = [
+        (client['chadd_ingestion_db']['posts'], ['post_id'], _native_ingestion_post),
+        (client['chadd_staging_db']['posts'],
+         ['date_created', 'post_id', 'author.author_id', 'responses.date_created', 'responses.response_id'],
+         _native_staging_post),
+        (client['chadd_staging_db']['members'], ['author_id'], _native_member),
+        # Reddit IDs are base 36 strings, only the HealthUnlocked ones are converted
+        (client['Production_db']['posts'], ['created_at'], _native_production_post),
+        (client['Production_db']['members'], ['author_id'], _native_member),
+    ]
+
+    unconverted = {}
+    for collection, fields, convert in migrations:
+        query = {'$or': [{field: {'$type': 'string'}} for field in fields]}
+        operations = []
+        migrated = 0
+        errors = []
+        for document in collection.find(query, batch_size=batch_size):
+            changes = convert(document, errors)
+            if changes:
+                operations.append(UpdateOne({'_id': document['_id']}, {'$set': changes}))
+            if len(operations) >= batch_size:
+                migrated += collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            migrated += collection.bulk_write(operations, ordered=False).modified_count
+        print(f"{collection.full_name}: {migrated} documents migrated, {len(errors)} values left unconverted.")
+        for value in errors[:10]:
+            print(f"    unconverted: {value!r}")
+        unconverted[collection.full_name] = len(errors)
+
+    # The date indexes are declared in src/utils/indexes.py
+    ensure_indexes(['chadd_staging_db', 'Production_db'])
+    return unconverted
+
+def _to_datetime(value, errors):
+    # Covers isoformat() output and the "%Y-%m-%dT%H:%M:%S.%fZ" strings written by the scrapers
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+        except ValueError:
+            errors.append(value)
+    return value
+
+def _to_int(value, errors):
+    if isinstance(value, str):
+        if value.isdigit():
+            return int(value)
+        errors.append(value)
+    return value
+
+def _native_ingestion_post(document, errors):
+    return {'post_id': _to_int(document.get('post_id'), errors)}
+
+def _native_staging_post(document, errors):
+    changes = {
+        'date_created': _to_datetime(document.get('date_created'), errors),
+        'post_id': _to_int(document.get('post_id'), errors),
+    }
+    if isinstance(document.get('author'), dict):
+        changes['author.author_id'] = _to_int(document['author'].get('author_id'), errors)
+    if document.get('responses'):
+        changes['responses'] = [
+            dict(response, date_created=_to_datetime(response.get('date_created'), errors),
+                 response_id=_to_int(response.get('response_id'), errors))
+            for response in document['responses']
+        ]
+    return changes
+
+def _native_member(document, errors):
+    return {'author_id': _to_int(document.get('author_id'), errors)}
 
-    print("Production database created successfully!")
\ No newline at end of file
+def _native_production_post(document, errors):
+    changes = {'created_at': _to_datetime(document.get('created_at'), errors)}
+    if document.get('Source') == 'HealthUnlocked':
+        changes['id'] = _to_int(document.get('id'), errors)
+    return changes
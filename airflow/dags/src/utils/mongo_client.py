@@ -0,0 +1,135 @@
+import os
+import threading
+from collections import Counter
+from typing import Optional
+
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+# Connection settings, overridable from the environment of the Airflow workers
+MONGO_HOST = os.getenv('MONGO_HOST', 'mongo')
+MONGO_PORT = int(os.getenv('MONGO_PORT', '27017'))
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '20'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+# Unset means no timeout, long aggregations and bulk writes can take a while
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '0')) or None
+# zlib is built into Python, snappy and zstd need extra packages on the client
+MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', 'zlib')
+
+
+class PoolStatsListener(ConnectionPoolListener):
+    """
+    Count the connection pool events of the shared client, to see how many connections
+    are opened and how often they are reused.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def pool_created(self, event):
+        self._count('pools_created')
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count('pools_cleared')
+
+    def pool_closed(self, event):
+        self._count('pools_closed')
+
+    def connection_created(self, event):
+        self._count('connections_created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count('connections_closed')
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._count('check_outs_failed')
+
+    def connection_checked_out(self, event):
+        self._count('check_outs')
+
+    def connection_checked_in(self, event):
+        pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.counts)
+        stats['connections_open'] = stats.get('connections_created', 0) - stats.get('connections_closed', 0)
+        return stats
+
+
+_client: Optional[MongoClient] = None
+_client_pid: Optional[int] = None
+_listener = PoolStatsListener()
+_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    """
+    Get the MongoClient shared by every helper of the process. It is created on first use, and
+    created again in a forked child (pymongo clients must not be used across a fork), so each task
+    process keeps one connection pool instead of opening a new one per helper call.
+    Do not close the returned client, use close_client instead.
+
+    :return: The shared client
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = MongoClient(
+                host=MONGO_HOST,
+                port=MONGO_PORT,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                compressors=MONGO_COMPRESSORS,
+                event_listeners=[_listener],
+            )
+            _client_pid = pid
+        return _client
+
+
+def close_client() -> None:
+    """
+    Close the shared client, the next get_client call creates a new one.
+    """
+    global _client, _client_pid
+
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client, _client_pid = None, None
+
+
+def pool_stats() -> dict:
+    """
+    Connection pool counters of the process: connections created and closed, check-outs...
+    Many check-outs for few created connections means the pool is doing its job.
+    """
+    return _listener.snapshot()
+
+
+def print_pool_stats() -> None:
+    print(f"MongoDB connection pool: {pool_stats()}")
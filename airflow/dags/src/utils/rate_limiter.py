@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+# Status codes worth retrying: the server is throttling us or temporarily failing
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    def __init__(self, rate: float = 5.0, burst: int = 10, max_concurrency: int = 8, min_concurrency: int = 1,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 error_threshold: float = 0.2, window: int = 50):
+        """
+        Token bucket shared by every thread sending requests to the same server.
+        Requests are spaced to at most rate per second (with bursts of up to burst requests),
+        and the number of requests in flight shrinks when the error rate goes up.
+
+        :param rate: The number of requests allowed per second on average
+        :param burst: The number of requests that can be sent back to back
+        :param max_concurrency: The maximum number of requests in flight
+        :param min_concurrency: The number of requests in flight the limiter never goes below
+        :param max_retries: The number of retries for a throttled or failed request
+        :param base_delay: The first retry delay in seconds, doubled on every attempt
+        :param max_delay: The maximum retry delay in seconds
+        :param error_threshold: The error rate over the last window responses that halves the concurrency
+        :param window: The number of responses used to compute the error rate
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.error_threshold = error_threshold
+        self.window = window
+
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.outcomes = deque(maxlen=window)
+        self.successes_since_change = 0
+
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """
+        Block until a request may be sent: a concurrency slot and a token are both available,
+        and no Retry-After pause is in progress.
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(self.blocked_until - now, 0.0)
+                if wait == 0.0 and self.in_flight < self.concurrency:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                # Woken up early when a slot is released or the concurrency changes
+                self._condition.wait(wait or None)
+
+    def release(self, status_code: Optional[int] = None, retry_after: Optional[float] = None) -> None:
+        """
+        Give the concurrency slot back and record the outcome of the request.
+
+        :param status_code: The status code of the response, None if the request raised
+        :param retry_after: The delay in seconds asked by the server, if any
+        """
+        with self._condition:
+            self.in_flight -= 1
+            failed = status_code is None or status_code in RETRYABLE_STATUS_CODES
+            self.outcomes.append(failed)
+
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+            if failed:
+                self.successes_since_change = 0
+                errors = sum(self.outcomes)
+                if len(self.outcomes) >= min(self.window, 10) and errors / len(self.outcomes) > self.error_threshold:
+                    self._set_concurrency(self.concurrency // 2)
+            else:
+                # Grow back slowly once the server is healthy again
+                self.successes_since_change += 1
+                if self.successes_since_change >= self.window:
+                    self._set_concurrency(self.concurrency + 1)
+
+            self._condition.notify_all()
+
+    def retry_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay before retrying, honoring Retry-After when the server sent one,
+        otherwise exponential in the attempt number with full jitter.
+
+        :param attempt: The number of the attempt that failed, starting at 0
+        :param retry_after: The delay in seconds asked by the server, if any
+        """
+        if retry_after:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def request(self, send: Callable):
+        """
+        Send a request through the limiter, retrying throttled (429) and failed (5xx) responses.
+
+        :param send: A function sending the request and returning a requests.Response
+        :return: The last response, which may still be an error once the retries are exhausted
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            try:
+                response = send()
+            except Exception:
+                self.release(None)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.retry_delay(attempt))
+                continue
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.release(response.status_code, retry_after)
+
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                return response
+
+            print(f"Got {response.status_code} from {response.url}, retrying ({attempt + 1}/{self.max_retries})...")
+            time.sleep(self.retry_delay(attempt, retry_after))
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _set_concurrency(self, concurrency: int) -> None:
+        concurrency = max(self.min_concurrency, min(self.max_concurrency, concurrency))
+        if concurrency != self.concurrency:
+            print(f"Rate limiter concurrency: {self.concurrency} -> {concurrency}")
+            self.concurrency = concurrency
+            self.outcomes.clear()
+        self.successes_since_change = 0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header, given either in seconds or as an HTTP date.
+
+    :return: The delay in seconds, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
@@ -21,5 +21,8 @@ echo "🟢 Created sentimentizer model!"
 ollama create selfdiagnosis-detectionizer -f ./selfdiagnosis-detection-modelfile
 echo "🟢 Created selfdiagnosis-detectionizer model!"
 
+ollama create post-classifier -f ./post-classifier-modelfile
+echo "🟢 Created post-classifier model!"
+
 # Wait for Ollama process to finish.
 wait $pid
\ No newline at end of file